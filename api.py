@@ -0,0 +1,286 @@
+"""Headless HTTP query API over the dashboard's data (tornado, no Streamlit).
+
+    python api.py --port 8502
+
+Every endpoint is a GET under /v1 and answers JSON, or an Arrow IPC stream
+with ``?format=arrow`` (or ``Accept: application/vnd.apache.arrow.stream``):
+
+    /v1/version                                  data version and periods
+    /v1/domains?dimension=industry               domains of a dimension
+    /v1/view?dimension=&domain=&year=            current-view rows (cube columns included)
+    /v1/kpi?dimension=&domain=&year=             any-incident estimate, sum and intervals
+    /v1/top?n=5&start=2021&end=2023              largest changes, z-tests and intervals
+    /v1/raw?dimension=&domain=                   published share/moe per wave
+
+``year`` is a wave, "Average" or a projected wave; it defaults to the latest
+wave, ``start``/``end`` to the two latest. Queries go through queries.py, the
+same memoized code the dashboard runs. A parameter the endpoint does not
+read is a 400.
+
+Responses carry an ETag derived from the data version and the normalised
+query, checked against If-None-Match before any work is done. Bodies are
+serialised once per (version, query, format) and kept in RESOURCES, so a
+repeat request is a cache lookup plus a socket write. The survey on disk is
+re-checked at most every VERSION_TTL seconds; a response is always built
+from the survey whose version is in its ETag.
+"""
+import argparse
+import hashlib
+import json
+import threading
+import time
+from typing import Any, Callable
+
+import pandas as pd
+import pyarrow as pa
+import tornado.ioloop
+import tornado.web
+
+import dataset
+import queries
+from cache import RESOURCES
+
+VERSION_TTL = 5.0
+JSON = "application/json"
+ARROW = "application/vnd.apache.arrow.stream"
+DIMENSIONS = ["industry", "size", "region"]
+MAX_TOP = 1000
+
+
+class QueryError(Exception):
+    """A request the data cannot answer; ``status`` is the HTTP status to send."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+class _Survey:
+    """Survey of the extracts on disk, re-checked at most every ``ttl`` seconds."""
+
+    def __init__(self, ttl: float = VERSION_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._checked = -float("inf")
+        self._survey: dataset.Survey | None = None
+
+    def get(self) -> dataset.Survey:
+        now = time.monotonic()
+        if now - self._checked < self.ttl and self._survey is not None:
+            return self._survey
+        with self._lock:
+            if now - self._checked >= self.ttl or self._survey is None:
+                self._survey = queries.current_survey()
+                self._checked = now
+        return self._survey
+
+
+# -----------------------------------------------------------------------------
+# Queries -> frames / documents
+# -----------------------------------------------------------------------------
+
+def _period(survey: dataset.Survey, value: str | None) -> int | str:
+    periods = queries.load_cube(survey).periods
+    if value is None:
+        return survey.years[-1]
+    period: int | str = value if value == dataset.AVERAGE else _int(value, "year")
+    if period not in periods:
+        raise QueryError(f"unknown year {value!r}; one of {', '.join(map(str, periods))}")
+    return period
+
+
+def _int(value: str, name: str) -> int:
+    try:
+        return int(value)
+    except ValueError:
+        raise QueryError(f"{name} must be an integer, not {value!r}") from None
+
+
+def _view(survey: dataset.Survey, args: dict[str, str]) -> tuple[str, str]:
+    dimension, domain = args.get("dimension"), args.get("domain")
+    if dimension is None or domain is None:
+        raise QueryError("dimension and domain are required")
+    if (dimension, domain) not in survey.selections():
+        raise QueryError(f"unknown view {dimension!r} / {domain!r}", 404)
+    return dimension, domain
+
+
+def _version(survey: dataset.Survey, args: dict[str, str]) -> dict[str, Any]:
+    cube = queries.load_cube(survey)
+    return {"version": survey.version, "years": survey.years, "periods": cube.periods, "projected": cube.projected}
+
+
+def _domains(survey: dataset.Survey, args: dict[str, str]) -> pd.DataFrame:
+    dimension = args.get("dimension")
+    if dimension not in DIMENSIONS:
+        raise QueryError(f"dimension must be one of {', '.join(DIMENSIONS)}")
+    return pd.DataFrame({"domain": survey.domains(dimension)})
+
+
+def _rows(survey: dataset.Survey, args: dict[str, str]) -> pd.DataFrame:
+    dimension, domain = _view(survey, args)
+    return queries.view_rows(survey, dimension, domain, _period(survey, args.get("year")))
+
+
+def _kpi(survey: dataset.Survey, args: dict[str, str]) -> dict[str, Any]:
+    dimension, domain = _view(survey, args)
+    period = _period(survey, args.get("year"))
+    return {"dimension": dimension, "domain": domain, "year": period, **queries.kpi(survey, dimension, domain, period)}
+
+
+def _top(survey: dataset.Survey, args: dict[str, str]) -> pd.DataFrame:
+    start, end = queries.delta_window(survey)
+    start = _int(args["start"], "start") if "start" in args else start
+    end = _int(args["end"], "end") if "end" in args else end
+    if start not in survey.years or end not in survey.years:
+        raise QueryError(f"start and end must be survey waves ({', '.join(map(str, survey.years))})")
+    if start >= end:
+        raise QueryError("start must be an earlier wave than end")
+    n = _int(args.get("n", "5"), "n")
+    if not 1 <= n <= MAX_TOP:
+        raise QueryError(f"n must be between 1 and {MAX_TOP}")
+    return queries.top_deltas(survey, n, start, end).reset_index(names="series")
+
+
+def _raw(survey: dataset.Survey, args: dict[str, str]) -> pd.DataFrame:
+    dimension, domain = _view(survey, args)
+    return queries.raw_numbers(survey, dimension, domain).reset_index()
+
+
+ENDPOINTS: dict[str, Callable[[dataset.Survey, dict[str, str]], pd.DataFrame | dict[str, Any]]] = {
+    "version": _version,
+    "domains": _domains,
+    "view": _rows,
+    "kpi": _kpi,
+    "top": _top,
+    "raw": _raw,
+}
+# Query parameters each endpoint reads; anything else is rejected, so a
+# stray parameter cannot mint its own ETag and RESOURCES entry.
+ENDPOINT_PARAMS: dict[str, set[str]] = {
+    "version": set(),
+    "domains": {"dimension"},
+    "view": {"dimension", "domain", "year"},
+    "kpi": {"dimension", "domain", "year"},
+    "top": {"n", "start", "end"},
+    "raw": {"dimension", "domain"},
+}
+
+
+# -----------------------------------------------------------------------------
+# Serialisation
+# -----------------------------------------------------------------------------
+
+def _flatten(document: dict[str, Any], prefix: str = "") -> dict[str, Any]:
+    flat: dict[str, Any] = {}
+    for key, value in document.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{name}."))
+        elif isinstance(value, list):
+            flat[name] = json.dumps(value)
+        else:
+            flat[name] = value
+    return flat
+
+
+def to_json(result: pd.DataFrame | dict[str, Any], version: str) -> bytes:
+    if isinstance(result, pd.DataFrame):
+        return f'{{"version":"{version}","rows":{result.to_json(orient="records", force_ascii=False)}}}'.encode()
+    return json.dumps({"version": version, **result}, ensure_ascii=False, default=str).encode()
+
+
+def to_arrow(result: pd.DataFrame | dict[str, Any], version: str) -> bytes:
+    frame = result if isinstance(result, pd.DataFrame) else pd.DataFrame([_flatten(result)])
+    table = pa.Table.from_pandas(frame, preserve_index=False).replace_schema_metadata({"version": version})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def render(survey: dataset.Survey, endpoint: str, args: tuple[tuple[str, str], ...], fmt: str) -> bytes:
+    """Serialised response body for one normalised query (memoized per data version)."""
+
+    def build() -> bytes:
+        result = ENDPOINTS[endpoint](survey, dict(args))
+        return to_arrow(result, survey.version) if fmt == ARROW else to_json(result, survey.version)
+
+    return RESOURCES.get_or_build(f"api:{endpoint}", survey.version, build, args, fmt)
+
+
+# -----------------------------------------------------------------------------
+# HTTP
+# -----------------------------------------------------------------------------
+
+class QueryHandler(tornado.web.RequestHandler):
+    def initialize(self, survey: _Survey) -> None:
+        self.survey = survey
+
+    def get(self, endpoint: str) -> None:
+        if endpoint not in ENDPOINTS:
+            raise tornado.web.HTTPError(404)
+        fmt = self._format()
+        unknown = sorted(set(self.request.arguments) - ENDPOINT_PARAMS[endpoint] - {"format"})
+        if unknown:
+            accepted = ", ".join(sorted(ENDPOINT_PARAMS[endpoint] | {"format"}))
+            return self._error(400, f"unknown parameter {', '.join(unknown)}; {endpoint} accepts {accepted}")
+        args = tuple(sorted((name, self.get_argument(name)) for name in self.request.arguments if name != "format"))
+        try:
+            survey = self.survey.get()
+        except FileNotFoundError as exc:
+            return self._error(503, f"missing {exc}")
+
+        digest = hashlib.sha1(repr((endpoint, args, fmt)).encode()).hexdigest()[:16]
+        self.set_header("Etag", f'"{survey.version}-{digest}"')
+        self.set_header("Cache-Control", "no-cache")
+        self.set_header("Vary", "Accept")
+        if self.check_etag_header():
+            self.set_status(304)
+            return
+
+        try:
+            body = render(survey, endpoint, args, fmt)
+        except QueryError as exc:
+            self.clear_header("Etag")
+            return self._error(exc.status, str(exc))
+        self.set_header("Content-Type", fmt)
+        self.write(body)
+
+    def _format(self) -> str:
+        requested = self.get_argument("format", None)
+        if requested is not None:
+            if requested not in {"json", "arrow"}:
+                raise tornado.web.HTTPError(400, "format must be json or arrow")
+            return ARROW if requested == "arrow" else JSON
+        return ARROW if ARROW in self.request.headers.get("Accept", "") else JSON
+
+    def _error(self, status: int, message: str) -> None:
+        self.set_status(status)
+        self.set_header("Content-Type", JSON)
+        self.write(json.dumps({"error": message}))
+
+
+def make_app(version_ttl: float = VERSION_TTL) -> tornado.web.Application:
+    return tornado.web.Application([(r"/v1/(\w+)", QueryHandler, {"survey": _Survey(version_ttl)})])
+
+
+def warm() -> None:
+    """Build the shared artefacts before accepting requests, so no request pays for them."""
+    survey = queries.current_survey()
+    queries.load_cube(survey)
+    queries.load_intervals(survey, *queries.delta_window(survey))
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8502)
+    parser.add_argument("--address", default="127.0.0.1")
+    args = parser.parse_args(argv)
+    warm()
+    make_app().listen(args.port, args.address)
+    tornado.ioloop.IOLoop.current().start()
+
+
+if __name__ == "__main__":
+    main()
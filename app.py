@@ -1,195 +1,376 @@
+import time
+from typing import Callable
+
 import streamlit as st
 import pandas as pd
-import altair as alt
-import numpy as np  # v3
-from pathlib import Path
+
+import charts
+import dataset
+from cache import RESOURCES
+from cube import ESTIMATED
+from export import PARQUET, ZIP, ExportJob, selection
+from queries import (
+    csv_export,
+    current_survey,
+    delta_window,
+    load_clusters,
+    load_cube,
+    load_risk_model,
+    max_share,
+    raw_numbers as view_raw_numbers,
+    tested_changes,
+    top_changes,
+    top_deltas,
+    view_intervals,
+    view_rows,
+)
+from significance import significant_changes
 
 st.set_page_config(page_title="Swedish Cyber‑Incident Dashboard", layout="wide")
 
 # -----------------------------------------------------------------------------
-# 1. DATA LOADING – FOUR SEPARATE DATAFRAMES  (v1)
-# -----------------------------------------------------------------------------
-@st.cache_data(show_spinner=False)
-def load_all() -> dict[str, pd.DataFrame]:  # v1
-    """Read each CSV separately with correct encoding and return a dict of DataFrames."""
-    files = {
-        "industry": "industry.csv",
-        "region": "regions.csv",
-        "size_s": "S-enterprises.csv",
-        "size_ml": "M-L-enterprises.csv",
-    }
-    dfs: dict[str, pd.DataFrame] = {}
-    for key, fname in files.items():
-        path = Path(__file__).parent / fname
-        if not path.exists():
-            st.error(f"Missing {fname}. Place all CSVs next to app.py and restart.")
-            st.stop()
-        df = pd.read_csv(path, sep=";", dtype=str, encoding="cp1252", skiprows=1)
-        df.columns = [
-            "incident_type",
-            "domain",
-            "share_2021",
-            "share_2023",
-            "moe_2021",
-            "moe_2023",
-        ]
-        num_cols = ["share_2021", "share_2023", "moe_2021", "moe_2023"]
-        df[num_cols] = df[num_cols].apply(pd.to_numeric, errors="coerce")
-        dfs[key] = df
-    return dfs
-
-# -----------------------------------------------------------------------------
-# 2. GLOBAL PRE‑COMPUTATIONS  (v1 & v4)
-# -----------------------------------------------------------------------------
-
-dfs = load_all()
-
-df_global = pd.concat(dfs.values(), ignore_index=True)
-df_global["delta"] = df_global["share_2023"] - df_global["share_2021"]
+# 1. DATA LOADING – LONG-FORMAT SURVEY STORE  (v1 + v5)
+# -----------------------------------------------------------------------------
+def load_all() -> dataset.Survey:  # v5 + v7
+    """Load every CSV via the on-disk snapshot cache into one year-indexed Survey.
+
+    v7: held in the process-wide RESOURCES cache, so every session shares one
+    copy instead of st.cache_data handing each rerun its own unpickled copy.
+    """
+    try:
+        return current_survey()
+    except FileNotFoundError as exc:
+        st.error(f"Missing {exc}. Place all CSVs next to app.py and restart.")
+        st.stop()
+
+
+# v7: derived global artefacts, shared by all sessions and keyed by data version.
+# v21: the loaders live in queries.py, shared with the HTTP API (api.py).
+
+
+# -----------------------------------------------------------------------------
+# 2. GLOBAL PRE‑COMPUTATIONS  (v1 & v4 & v7)
+# -----------------------------------------------------------------------------
+
+survey = load_all()
+df_global = survey.long
+YEARS = survey.years
+YEARS_LABEL = " & ".join([", ".join(map(str, YEARS[:-1])), str(YEARS[-1])]) if len(YEARS) > 1 else str(YEARS[0])
 
 # v4: compute overall max share to use as fixed X‑axis limit
-MAX_SHARE = df_global[["share_2021", "share_2023"]].max().max()
+MAX_SHARE = max_share(survey)
+
+# v5: year‑on‑year change between the two latest survey waves
+DELTA_START, DELTA_END = delta_window(survey)
+abs_top5 = top_changes(survey, 5, DELTA_START, DELTA_END)
 
-abs_top5 = df_global.loc[
-    df_global["delta"].abs().sort_values(ascending=False).head(5).index
-][[
-    "incident_type",
-    "domain",
-    "share_2021",
-    "share_2023",
-    "delta",
-]]
+# v5: every view's KPI / bar values, materialized once per data version
+cube = load_cube(survey)
 
 # -----------------------------------------------------------------------------
-# 3. SIDEBAR FILTERS – DIMENSION, DOMAIN, YEAR  (v2)
+# 3. CURRENT VIEW FRAGMENT – FILTERS, KPI, BAR, PIE, RAW NUMBERS  (v2 + v3 + v4 + v6 + v9)
 # -----------------------------------------------------------------------------
+# v6: everything that depends on the filters lives in one fragment, so a
+# filter change reruns only this block. The global sections below are only
+# re-executed on a full rerun (page load / new data version). Fragments
+# cannot place widgets in the sidebar, hence the filter row in the page body.
 
-st.sidebar.title("Filters")
+st.title("Swedish Cyber‑Incident Statistics")
 
-dimension = st.sidebar.radio("Domain type", ["industry", "size", "region"], index=0)
 
-if dimension == "industry":
-    df_dim = dfs["industry"].copy()
-elif dimension == "region":
-    df_dim = dfs["region"].copy()
-else:  # size
-    df_dim = pd.concat([dfs["size_s"], dfs["size_ml"]], ignore_index=True)
+# v9: st.expander executes its body even while collapsed, so sections whose
+# content is costly use a toggle as the open/close control and only build
+# their content once opened. Each is a fragment: toggling it reruns nothing else.
+@st.fragment
+def lazy_section(label: str, render: Callable[..., None], *args) -> None:
+    if st.toggle(label, key=f"open:{label}"):
+        with st.container(border=True):
+            render(*args)
 
-year_choice = st.sidebar.radio("Year", [2023, 2021, "Average"], index=0, format_func=str)
 
-options = sorted(df_dim["domain"].unique())
-if dimension == "industry":
-    default_value = "Total (SNI 10-63, 68-75, 77-82, 95.1)"
-elif dimension == "size":
-    default_value = "10 or more employees in total"
-else:
-    default_value = "Sweden"
+def show_chart(kind: str, key: tuple, build: Callable[[], object]) -> None:
+    # v24: cached spec with Arrow datasets; payload size and render time per chart
+    started = time.perf_counter()
+    spec = charts.cached_spec(kind, survey.version, key, build)
+    st.vega_lite_chart(spec, use_container_width=True)
+    charts.record_render(kind, spec, time.perf_counter() - started)
 
-domain = st.sidebar.selectbox("Domain value", options=options, index=options.index(default_value) if default_value in options else 0)
 
-df_sel = df_dim[df_dim["domain"] == domain].copy()
+@st.fragment
+def current_view() -> None:
+    """Filters plus the KPI, charts and raw numbers for the selected view."""
+    col_dim, col_year, col_domain = st.columns([1, 1, 2])
 
-# -----------------------------------------------------------------------------
-# 4. CURRENT VIEW – KPI, BAR, PIE  (v3 + v4)
-# -----------------------------------------------------------------------------
+    dimension = col_dim.radio("Domain type", ["industry", "size", "region"], index=0, horizontal=True)
 
-if year_choice == "Average":
-    df_sel["current_share"] = df_sel[["share_2021", "share_2023"]].mean(axis=1)
-    share_label = "Average of 2021 & 2023"
-else:
-    df_sel["current_share"] = df_sel[f"share_{year_choice}"]
-    share_label = str(year_choice)
+    # v19: trend projections of the upcoming waves as extra, labelled options
+    year_choice = col_year.radio(
+        "Year",
+        [*reversed(YEARS), dataset.AVERAGE, *cube.projected],
+        index=0,
+        format_func=lambda y: f"{y} (projected)" if y in cube.projected else str(y),
+        horizontal=True,
+    )
 
-cumulative = df_sel["current_share"].sum(skipna=True)
+    options = survey.domains(dimension)
+    if dimension == "industry":
+        default_value = "Total (SNI 10-63, 68-75, 77-82, 95.1)"
+    elif dimension == "size":
+        default_value = "10 or more employees in total"
+    else:
+        default_value = "Sweden"
 
-st.title("Swedish Cyber‑Incident Statistics")
-st.subheader(f"{dimension.capitalize()}: {domain}")
+    # v17: size bands in hierarchy order, each sub-band indented under its parent
+    depth: dict[str, int] = {}
+    if dimension == "size":
+        depth = dict(zip(survey.sizes.labels, survey.sizes.depth.tolist()))
+        options = [*survey.sizes.labels, *(d for d in options if d not in depth)]
 
-st.markdown(
-    f"**Total share of enterprises affected ({share_label})**: "
-    f"<span style='font-size:48px;font-weight:bold'>{cumulative:.1f}%</span>",
-    unsafe_allow_html=True,
-)
+    domain = col_domain.selectbox(
+        "Domain value",
+        options=options,
+        index=options.index(default_value) if default_value in options else 0,
+        format_func=lambda d: "\u2003" * depth.get(d, 0) + d,
+    )
+
+    # v5: precomputed (dimension, domain) index – a dict lookup plus a row slice
+    df_sel = view_rows(survey, dimension, domain, year_choice)
+    share_label = f"Average of {YEARS_LABEL}" if year_choice == dataset.AVERAGE else str(year_choice)
+    if year_choice in cube.projected:
+        share_label = f"{year_choice}, projected"
 
-# v3: differentiate 0 % vs missing data
-
-df_sel["current_share_filled"] = df_sel["current_share"].fillna(0.1)
-df_sel["status"] = np.where(df_sel["current_share"].isna(), "Data unavailable", "Reported")
-
-# v4: fixed X‑axis scale using overall MAX_SHARE
-bar_chart = (
-    alt.Chart(df_sel)
-    .mark_bar()
-    .encode(
-        y=alt.Y("incident_type:N", sort="-x", title="Incident type"),
-        x=alt.X(
-            "current_share_filled:Q",
-            title="Share (%)",
-            scale=alt.Scale(domain=[0, MAX_SHARE + 1]),  # v4 fixed scale
-        ),
-        color=alt.Color(
-            "status:N",
-            scale=alt.Scale(domain=["Reported", "Data unavailable"], range=["#1f77b4", "#cccccc"]),
-            legend=alt.Legend(title=""),
-        ),
-        tooltip=[
-            "incident_type:N",
-            alt.Tooltip("current_share_filled:Q", title="Share (%)", format=".1f"),
-            "status:N",
-        ],
+    cumulative = cube.total(dimension, domain, year_choice)
+    any_incident = cube.any_incident(dimension, domain, year_choice)
+    spread = view_intervals(survey, dimension, domain, year_choice)
+
+    st.subheader(f"{dimension.capitalize()}: {domain}")
+
+    # v12: the incident types overlap, so their sum overstates the share affected
+    st.markdown(
+        f"**Share of enterprises with any incident ({share_label})**: "
+        f"<span style='font-size:48px;font-weight:bold'>{any_incident['estimate']:.1f}%</span>",
+        unsafe_allow_html=True,
     )
-    .properties(height=400)
-)
-st.altair_chart(bar_chart, use_container_width=True)
-
-# Pie chart unchanged – only uses available data
-pie_chart = (
-    alt.Chart(df_sel[df_sel["status"] == "Reported"])
-    .mark_arc()
-    .encode(
-        theta="current_share_filled:Q",
-        color="incident_type:N",
-        tooltip=["incident_type", "current_share_filled"],
+    basis = "adjusted for incident co-occurrence" if cube.correlated else "assuming incident types occur independently"
+    st.caption(
+        f"Estimate {basis}; bounds {any_incident['lower']:.1f}–{any_incident['upper']:.1f}%. "
+        f"Adding up the incident types gives {cumulative:.1f}%, which counts enterprises hit by several types more than once."
+    )
+    # v13: sampling uncertainty propagated from the margins of error
+    st.caption(
+        f"95 % sampling interval: {spread['any'][0]:.1f}–{spread['any'][1]:.1f}% with any incident "
+        f"(independence), {spread['total'][0]:.1f}–{spread['total'][1]:.1f}% for the sum."
     )
-    .properties(height=300)
-)
-st.altair_chart(pie_chart, use_container_width=True)
 
-# -----------------------------------------------------------------------------
-# 5. STATIC TOP‑5 DELTAS (2021 → 2023) ACROSS ENTIRE SURVEY  (v1)
-# -----------------------------------------------------------------------------
-with st.expander("📈 Top 5 largest year‑on‑year changes across Sweden (static)"):
-    st.dataframe(abs_top5, use_container_width=True)
-    delta_bar = (
-        alt.Chart(abs_top5)
-        .mark_bar()
-        .encode(
-            y=alt.Y("incident_type:N", sort="-x", title=""),
-            x=alt.X("delta:Q", title="Δ (pp)"),
-            color=alt.condition(alt.datum.delta > 0, alt.value("#d62728"), alt.value("#1f77b4")),
-            tooltip=["domain", "incident_type", "delta"],
+    # v18: suppressed cells are estimated rather than left out
+    estimated = int((df_sel["status"] == ESTIMATED).sum())
+    if estimated:
+        st.caption(
+            f"{estimated} suppressed share{'s' if estimated > 1 else ''} estimated from the parent domain "
+            "and the other wave (light bars); the figures above include them."
         )
-        .properties(height=300)
-    )
-    st.altair_chart(delta_bar, use_container_width=True)
 
-# -----------------------------------------------------------------------------
-# 6. RAW NUMBERS EXPANDER  (v1)
-# -----------------------------------------------------------------------------
-with st.expander("Raw numbers"):
+    if year_choice in cube.projected:
+        st.caption(
+            f"Projection: a weighted logit trend through {YEARS_LABEL} per series, with weak trends "
+            "shrunk towards no change; the interval above is its 95 % prediction interval."
+        )
+
+    # v8: finished Vega-Lite specs are cached per (dimension, domain, year, data version)
+    key = (dimension, domain, year_choice)
+    show_chart("bar", key, lambda: charts.bar_chart(df_sel, MAX_SHARE))
+    show_chart("pie", key, lambda: charts.pie_chart(df_sel))
+
+    # v1 + v9: raw numbers for the current selection, built only when opened
+    lazy_section("Raw numbers", raw_numbers, dimension, domain, year_choice)
+
+
+def raw_numbers(dimension: str, domain: str, year_choice: int | str) -> None:
     st.dataframe(
-        df_sel.set_index("incident_type")[["share_2021", "moe_2021", "share_2023", "moe_2023"]],
+        view_raw_numbers(survey, dimension, domain),
         use_container_width=True,
     )
     st.download_button(
         "Download CSV",
-        data=df_sel.to_csv(index=False, sep=";", encoding="cp1252").encode("cp1252"),
+        data=csv_export(survey, dimension, domain, year_choice),
         file_name=f"{dimension}_{domain.replace(' ', '_')}.csv",
         mime="text/csv",
     )
 
+
+current_view()
+
 # -----------------------------------------------------------------------------
-# 7. ABOUT EXPANDER  (v1)
+# 4. STATIC TOP‑5 DELTAS (PREVIOUS → LATEST WAVE) ACROSS ENTIRE SURVEY  (v1 + v5 + v9)
 # -----------------------------------------------------------------------------
-with st.expander("About"):
-    st.markdown("Data source: *SCB – IT‑relaterade säkerhetsincidenter*, survey years 2021 & 2023.")
+def top5_section() -> None:
+    # v11 + v13: z-test against the margins of error, delta interval and how
+    # often each series makes the top 5 across Monte Carlo draws
+    st.dataframe(top_deltas(survey, 5, DELTA_START, DELTA_END), use_container_width=True)
+    df_tested = tested_changes(survey, DELTA_START, DELTA_END)
+    show_chart("delta", (DELTA_START, DELTA_END), lambda: charts.delta_bar(abs_top5))
+
+    # v25: every series' change at once, binned server-side
+    st.markdown(f"**Distribution of all changes** ({DELTA_START} → {DELTA_END})")
+    show_chart(
+        "change_histogram",
+        (DELTA_START, DELTA_END),
+        lambda: charts.change_histogram(df_tested["delta"].to_numpy(dtype=float)),
+    )
+
+    # v11: ranking that ignores changes within the margins of error
+    sig_top5 = significant_changes(df_tested, 5)
+    st.markdown("**Statistically significant changes** (z-test on the margins of error, Benjamini–Hochberg q < 0.05)")
+    if sig_top5.empty:
+        n_tests = int(df_tested["p"].notna().sum())
+        st.caption(f"No change between {DELTA_START} and {DELTA_END} is significant after correcting for {n_tests} tests.")
+    else:
+        st.dataframe(sig_top5.drop(columns=["significant"]), use_container_width=True)
+
+
+lazy_section(f"📈 Top 5 largest year‑on‑year changes across Sweden ({DELTA_START} → {DELTA_END}, static)", top5_section)
+
+# -----------------------------------------------------------------------------
+# 5. ENTERPRISE PROFILE RISK SCORE  (v14)
+# -----------------------------------------------------------------------------
+def risk_section() -> None:
+    model = load_risk_model(survey)
+    col_ind, col_reg, col_size, col_year = st.columns([2, 2, 2, 1])
+    industry = col_ind.selectbox("Industry", model.bands["industry"], key="risk:industry")
+    region = col_reg.selectbox("Region", model.bands["region"], key="risk:region")
+    size = col_size.selectbox("Size", model.bands["size"], key="risk:size")
+    period = col_year.selectbox("Year", [*reversed(YEARS), dataset.AVERAGE], key="risk:year")
+
+    any_incident = model.any_incident(industry, region, size, period)
+    st.markdown(
+        f"**Estimated share of such enterprises with any incident**: "
+        f"<span style='font-size:36px;font-weight:bold'>{any_incident['estimate']:.1f}%</span>",
+        unsafe_allow_html=True,
+    )
+    residual = model.residual[model.periods.index(period)]
+    st.caption(
+        f"Bounds {any_incident['lower']:.1f}–{any_incident['upper']:.1f}%. SCB publishes industry, region and size "
+        f"separately; the joint profile is raked from those margins (largest remaining gap {residual:.1f} pp)."
+    )
+    # industry and region figures only describe enterprises with 10+ employees
+    if size in model.covered:
+        st.caption(f"Population: enterprises with {size}, the part of the industry and region figures this band covers.")
+    else:
+        st.caption(
+            f"Population: enterprises with {size}. SCB's industry and region figures exclude this band, so the "
+            "profile's industry and region effect is carried over and shifted to the band's published share."
+        )
+    st.dataframe(model.score(industry, region, size, period).round(1), use_container_width=True)
+
+
+lazy_section("🎯 Risk score by enterprise profile", risk_section)
+
+# -----------------------------------------------------------------------------
+# 6. DOMAIN SIMILARITY CLUSTERS  (v20)
+# -----------------------------------------------------------------------------
+def clusters_section() -> None:
+    period = st.selectbox("Year", [*reversed(YEARS), dataset.AVERAGE], key="clusters:year")
+    clusters = load_clusters(survey, period)
+    st.caption(
+        f"{clusters.k} groups of domains with similar incident mixes (spherical k-means on cosine distance, "
+        f"k chosen by silhouette, {clusters.silhouette:.2f}). Levels do not matter, only the proportions."
+    )
+    st.markdown("**Cluster centroids** – mean share of each incident type among the members (%)")
+    st.dataframe(
+        pd.DataFrame(clusters.profiles, columns=clusters.incident_types, index=pd.RangeIndex(clusters.k, name="cluster")).round(1),
+        use_container_width=True,
+    )
+    closest = [
+        "; ".join(f"{domain} ({similarity:.3f})" for (_, domain), similarity in clusters.similar(*view))
+        for view in clusters.views
+    ]
+    membership = pd.DataFrame(
+        {
+            "dimension": [dimension for dimension, _ in clusters.views],
+            "domain": [domain for _, domain in clusters.views],
+            "cluster": clusters.labels,
+            "most similar (cosine)": closest,
+        }
+    )
+    st.markdown("**Membership**")
+    st.dataframe(membership.sort_values(["cluster", "dimension", "domain"]), hide_index=True, use_container_width=True)
+
+
+lazy_section("🧩 Domains with similar incident mixes", clusters_section)
+
+# -----------------------------------------------------------------------------
+# 7. BULK EXPORT  (v23)
+# -----------------------------------------------------------------------------
+# v23: many views in one archive, written on a background thread; while the
+# job runs, a progress fragment polls it once a second. When it finishes the
+# archive is read once into the session and its working directory removed.
+EXPORT_FORMATS = {ZIP: "ZIP of CSVs", PARQUET: "Parquet dataset (zipped)"}
+
+
+def export_section() -> None:
+    col_dim, col_dom, col_year = st.columns([1, 2, 1])
+    dimensions = col_dim.multiselect("Domain types", ["industry", "size", "region"], default=["industry"], key="export:dimensions")
+    domains = col_dom.multiselect(
+        "Domains (empty = all)", [d for dim in dimensions for d in survey.domains(dim)], key="export:domains"
+    )
+    periods = col_year.multiselect("Years", cube.periods, default=list(reversed(YEARS)), key="export:years")
+    fmt = st.radio("Format", list(EXPORT_FORMATS), format_func=EXPORT_FORMATS.get, horizontal=True, key="export:format")
+    views = selection(survey, dimensions, domains or None, periods)
+    st.caption(f"{len(views)} views selected.")
+    if st.button("Start export", disabled=not views, key="export:start"):
+        previous = st.session_state.get("export:job")
+        if previous is not None:
+            previous.cleanup()
+        st.session_state.pop("export:payload", None)
+        st.session_state["export:job"] = ExportJob(survey, views, fmt)
+
+    job: ExportJob | None = st.session_state.get("export:job")
+    if job is None:
+        return
+    if not job.finished:
+        export_progress()
+    elif job.error:
+        st.error(f"Export failed: {job.error}")
+    else:
+        if "export:payload" not in st.session_state:
+            st.session_state["export:payload"] = job.path.read_bytes()
+            job.cleanup()
+        st.download_button(
+            f"Download {job.total} views",
+            data=st.session_state["export:payload"],
+            file_name=job.path.name,
+            mime="application/zip",
+            key="export:download",
+        )
+
+
+@st.fragment(run_every=1.0)
+def export_progress() -> None:
+    job: ExportJob = st.session_state["export:job"]
+    if job.finished:
+        st.rerun()  # the full run shows the result and no longer schedules this poll
+    st.progress(job.fraction, text=f"Exporting view {job.done} of {job.total}…")
+
+
+lazy_section("📦 Bulk export", export_section)
+
+# -----------------------------------------------------------------------------
+# 8. ABOUT SECTION  (v1 + v9)
+# -----------------------------------------------------------------------------
+def about_section() -> None:
+    st.markdown(f"Data source: *SCB – IT‑relaterade säkerhetsincidenter*, survey years {YEARS_LABEL}.")
+    stats = RESOURCES.stats()
+    st.caption(
+        f"Data version `{survey.version}` · shared cache: {stats['hits']} hits, {stats['misses']} misses, "
+        f"{stats['entries']} entries, {stats['bytes'] / 1024**2:.1f} of {stats['max_bytes'] / 1024**2:.0f} MiB"
+    )
+    # v24: what each chart kind last sent to the browser, and how long the server took
+    if charts.TRANSPORT:
+        st.markdown("**Chart transport** (latest per chart; Arrow datasets vs. the same rows as inline JSON)")
+        st.dataframe(
+            pd.DataFrame.from_dict({kind: vars(stats) for kind, stats in charts.TRANSPORT.items()}, orient="index").round(1),
+            use_container_width=True,
+        )
+
+
+lazy_section("About", about_section)
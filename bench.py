@@ -0,0 +1,279 @@
+"""Benchmark the dashboard's rerun path on synthetic SCB-shaped data.
+
+Generates the four extracts in SCB's format (cp1252, title line, ';'
+separated, '..' for suppressed cells) at several sizes, times each stage of
+the pipeline separately and finally drives app.py headless through
+Streamlit's AppTest. Results are written as JSON lines: an environment
+record first, then one record per (rows, stage), flushed as each size
+completes so a run that dies at a large size keeps the smaller ones.
+
+    python bench.py --rows 100 10000 1000000 --years 2019 2021 2023 --output bench.jsonl
+"""
+import argparse
+import contextlib
+import csv
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Iterator
+
+import numpy as np
+import pandas as pd
+
+import charts
+import dataset
+from cache import RESOURCES
+from cube import build_cube
+from domains import SNI_DIGITS
+from uncertainty import simulate
+
+APP = Path(__file__).parent / "app.py"
+
+TITLE = (
+    '"Share of enterprises who had any ICT related security incidents that led to '
+    'consequences by type of consequences, study domain, observations and year"'
+)
+
+INCIDENT_TYPES = [
+    "unavailability of ICT services due to hardware/software failures",
+    "unavailability of ICT services due to external cyberattacks",
+    "destruction/corruption of data due to hardware/software failures",
+    "destruction/corruption of data due to malicious software",
+    "disclosure of confidential data due to intentional actions by own employees",
+    "disclosure of confidential data due to unintentional actions by own employees",
+]
+
+# SNI parts of the real industry aggregates; the synthetic hierarchy starts with these.
+SNI_AGGREGATES = [
+    "10-63, 68-75, 77-82, 95.1",
+    "10-33",
+    "35-39",
+    "41-43",
+    "45-47",
+    "49-53",
+    "55-56",
+    "58-63",
+    "26.1-26.4, 26.8, 46.5, 58.2, 61-62, 63.1, 95.1",
+    "68",
+    "69-75, 77-82, 95.1",
+]
+
+
+def sni_codes(n: int) -> list[str]:
+    """``n`` SNI parts, breadth first: the aggregates, then divisions, groups, classes, detailed codes.
+
+    Like the real classification, each code nests in its parent and siblings
+    do not overlap. Past the 100 000 or so codes, the list repeats.
+    """
+    level = [str(division) for division in range(10, 100)]
+    codes = SNI_AGGREGATES + level
+    while len(codes) < n and len(level[0].replace(".", "")) < SNI_DIGITS:
+        level = [f"{code}{'.' if '.' not in code else ''}{digit}" for code in level for digit in range(10)]
+        codes += level
+    return [codes[i % len(codes)] for i in range(n)]
+
+
+def size_bands(n: int, first: int = 0, fanout: int = 5) -> list[str]:
+    """``n`` employee bands from ``first`` up, breadth first: each splits into ``fanout`` disjoint parts."""
+    depth = 0
+    while (fanout ** (depth + 1) - 1) // (fanout - 1) < n:
+        depth += 1
+    bands = [(first, first + fanout**depth)]
+    for lo, hi in bands:
+        if len(bands) >= n:
+            break
+        step = (hi - lo) // fanout
+        bands += [(lo + k * step, lo + (k + 1) * step) for k in range(fanout)]
+    return [f"{lo} employees" if hi - lo == 1 else f"{lo}-{hi - 1} employees" for lo, hi in bands[:n]]
+
+
+# Domain labels per extract, shaped like the real ones: nested SNI codes and
+# nested, non-overlapping size bands (the M-L tree sits above any S band).
+DOMAIN_LABELS: dict[str, Callable[[int], list[str]]] = {
+    "industry": lambda n: [f"synthetic industry {i} (SNI {code})" for i, code in enumerate(sni_codes(n))],
+    "region": lambda n: [f"Synthetic region {i}" for i in range(n)],
+    "size_s": lambda n: size_bands(n),
+    "size_ml": lambda n: size_bands(n, first=10**7),
+}
+
+
+# -----------------------------------------------------------------------------
+# Synthetic data
+# -----------------------------------------------------------------------------
+
+def generate(
+    out_dir: Path,
+    rows: int,
+    years: list[int],
+    types: int = len(INCIDENT_TYPES),
+    na_rate: float = 0.1,
+    seed: int = 0,
+) -> Path:
+    """Write four SCB-format extracts with ``rows`` data rows in total into ``out_dir``."""
+    rng = np.random.default_rng(seed)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    incident_types = INCIDENT_TYPES[:types] + [
+        f"synthetic incident type {i}" for i in range(len(INCIDENT_TYPES), types)
+    ]
+    per_file = max(types, rows // len(dataset.FILES))
+    header = ";".join(
+        ['"type of consequences"', '"study domain"']
+        + [f'"share of enterprises, percent {year}"' for year in years]
+        + [f'"margin of error, ± {year}"' for year in years]
+    )
+    for key, fname in dataset.FILES.items():
+        n_domains = -(-per_file // types)
+        domains = np.array([f'"{label}"' for label in DOMAIN_LABELS[key](n_domains)], dtype=object)
+        kinds = np.array([f'"{kind}"' for kind in incident_types], dtype=object)
+        # SCB order: incident type major, domain minor.
+        cols: dict[str, Any] = {
+            "incident_type": np.repeat(kinds, n_domains)[:per_file],
+            "domain": np.tile(domains, types)[:per_file],
+        }
+        shares = rng.integers(0, 60, size=(per_file, len(years)))
+        moes = rng.integers(1, 6, size=(per_file, len(years)))
+        missing = rng.random((per_file, len(years))) < na_rate
+        for j, year in enumerate(years):
+            cols[f"share_{year}"] = np.where(missing[:, j], dataset.NA_MARKER, shares[:, j].astype(str))
+        for j, year in enumerate(years):
+            cols[f"moe_{year}"] = np.where(missing[:, j], dataset.NA_MARKER, moes[:, j].astype(str))
+        with open(out_dir / fname, "w", encoding="cp1252", newline="") as fh:
+            fh.write(f"{TITLE}\r\n\r\n{header}\r\n")
+            pd.DataFrame(cols).to_csv(fh, sep=";", header=False, index=False, quoting=csv.QUOTE_NONE, lineterminator="\r\n")
+    return out_dir
+
+
+# -----------------------------------------------------------------------------
+# Stage timings
+# -----------------------------------------------------------------------------
+
+def timed(fn: Callable[[], Any], repeat: int) -> tuple[float, Any]:
+    """Median wall time of ``fn`` over ``repeat`` calls, plus its last result."""
+    times, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), result
+
+
+def bench_stages(data: Path, snapshots: Path, repeat: int, selections: int = 50) -> dict[str, float]:
+    paths = dataset.source_paths(data)
+    out: dict[str, float] = {}
+
+    out["parse"], long = timed(
+        lambda: dataset.build_long({key: dataset.parse_csv(path) for key, path in paths.items()}), repeat
+    )
+    out["load_all_cold"], _ = timed(lambda: dataset.load_survey(data, Path(tempfile.mkdtemp(dir=snapshots))), 1)
+    dataset.load_survey(data, snapshots)
+    out["load_all_warm"], survey = timed(lambda: dataset.load_survey(data, snapshots), repeat)
+    out["df_global"], survey = timed(lambda: dataset.Survey(long=long, version=survey.version), repeat)
+    out["abs_top5"], _ = timed(lambda: survey.top_changes(5), repeat)
+    out["cube"], cube = timed(lambda: build_cube(survey), repeat)
+    out["intervals"], _ = timed(lambda: simulate(survey), repeat)
+
+    rng = np.random.default_rng(0)
+    keys = list(survey.selections())
+    picks = [keys[i] for i in rng.integers(0, len(keys), size=selections)]
+    year = survey.years[-1]
+
+    def select() -> pd.DataFrame:
+        for dim, dom in picks:
+            df_sel = survey.view(dim, dom).join(cube.frame(dim, dom, year))
+        return df_sel
+
+    total, _ = timed(select, repeat)
+    out["select"] = total / selections
+
+    max_share = float(survey.long["share"].max())
+    views = [survey.view(dim, dom).join(cube.frame(dim, dom, year)) for dim, dom in picks[:5]]
+
+    def build_charts() -> None:
+        for df_sel in views:
+            charts.to_spec(charts.bar_chart(df_sel, max_share))
+            charts.to_spec(charts.pie_chart(df_sel))
+
+    total, _ = timed(build_charts, repeat)
+    out["charts"] = total / len(views)
+
+    total, _ = timed(
+        lambda: [df.to_csv(index=False, sep=";", encoding="cp1252").encode("cp1252") for df in views], repeat
+    )
+    out["csv_export"] = total / len(views)
+    return out
+
+
+def bench_app(data: Path, snapshots: Path, repeat: int, timeout: float) -> dict[str, float]:
+    """Full script runs through AppTest: first run, then reruns that change the domain."""
+    from streamlit.testing.v1 import AppTest
+
+    os.environ["SCB_DATA_DIR"] = str(data)
+    os.environ["SCB_SNAPSHOT_DIR"] = str(snapshots)
+    try:
+        at = AppTest.from_file(str(APP), default_timeout=timeout)
+        first, _ = timed(at.run, 1)
+        if at.exception:
+            raise RuntimeError(at.exception[0].message)
+        rng = np.random.default_rng(1)
+
+        def rerun() -> None:
+            box = next(s for s in at.selectbox if s.label == "Domain value")
+            box.set_value(box.options[rng.integers(0, len(box.options))]).run()
+
+        again, _ = timed(rerun, repeat)
+        return {"app_first_run": first, "app_rerun": again}
+    finally:
+        os.environ.pop("SCB_DATA_DIR", None)
+        os.environ.pop("SCB_SNAPSHOT_DIR", None)
+
+
+def run(
+    sizes: list[int], years: list[int], types: int, repeat: int, app: bool, timeout: float
+) -> Iterator[dict]:
+    """One record per (rows, stage), yielded as each size completes."""
+    for rows in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            data = generate(Path(tmp) / "data", rows, years, types)
+            snapshots = Path(tmp) / "snapshots"
+            snapshots.mkdir()
+            stages = bench_stages(data, snapshots, repeat)
+            if app:
+                RESOURCES.clear()
+                stages.update(bench_app(data, snapshots, repeat, timeout))
+        for stage, seconds in stages.items():
+            print(f"{rows:>9} rows  {stage:<14} {seconds * 1e3:10.2f} ms", file=sys.stderr, flush=True)
+            yield {"rows": rows, "stage": stage, "seconds": seconds}
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10**2, 10**3, 10**4, 10**5, 10**6], help="total data rows per run")
+    parser.add_argument("--years", type=int, nargs="+", default=[2021, 2023], help="survey waves to generate")
+    parser.add_argument("--types", type=int, default=len(INCIDENT_TYPES), help="incident types per domain")
+    parser.add_argument("--repeat", type=int, default=5, help="timings per stage (median is reported)")
+    parser.add_argument("--no-app", action="store_true", help="skip the AppTest full-script runs")
+    parser.add_argument("--timeout", type=float, default=120, help="AppTest timeout per run, seconds")
+    parser.add_argument("--output", type=Path, help="write JSON lines here instead of stdout")
+    args = parser.parse_args(argv)
+
+    header = {
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "years": args.years,
+        "types": args.types,
+    }
+    results = run(args.rows, args.years, args.types, args.repeat, not args.no_app, args.timeout)
+    with open(args.output, "w") if args.output else contextlib.nullcontext(sys.stdout) as out:
+        print(json.dumps(header), file=out, flush=True)
+        for record in results:
+            print(json.dumps(record), file=out, flush=True)
+
+
+if __name__ == "__main__":
+    main()
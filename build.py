@@ -0,0 +1,217 @@
+"""Prerender every dashboard view into a static directory.
+
+    python build.py site/ --workers 4
+
+For each dimension × domain × period (every wave, Average and the projected
+waves) the build writes
+
+    <out>/<dimension>/<domain-slug>/<period>/index.html   KPI, both charts, raw table
+                                            bar.vl.json / pie.vl.json
+                                            raw.csv       same CSV as "Download CSV"
+
+plus <out>/index.html linking every page and <out>/manifest.json. The pages
+load vega-embed from a CDN, so the directory can be served by any static
+file server.
+
+The manifest stores a digest of each page's inputs: its rows, KPI numbers,
+the shared axis limit and RENDER_VERSION (bump it when the page layout or
+the chart builders change). A rebuild computes the digests in this process,
+which is cheap because the cube is already materialised. Only pages whose
+digest changed are rendered, in a process pool. Pages that no longer exist
+are removed. Workers receive their inputs with the task and never load the
+data themselves.
+"""
+import argparse
+import hashlib
+import html
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+import pandas as pd
+
+import charts
+import dataset
+import queries
+
+RENDER_VERSION = "2"
+MANIFEST = "manifest.json"
+VEGA = [
+    "https://cdn.jsdelivr.net/npm/vega@5",
+    "https://cdn.jsdelivr.net/npm/vega-lite@5",
+    "https://cdn.jsdelivr.net/npm/vega-embed@6",
+]
+
+
+@dataclass(frozen=True)
+class Page:
+    """Everything one page needs, computed in the parent and shipped to a worker."""
+
+    path: str  # relative to the output directory
+    title: str
+    period_label: str
+    rows: pd.DataFrame  # view rows with the cube columns
+    kpi: dict[str, Any]
+    raw: pd.DataFrame
+    csv: bytes
+    max_share: float
+    digest: str
+
+
+def slug(text: str) -> str:
+    """File-system safe, stable name for a domain label."""
+    base = re.sub(r"[^a-z0-9]+", "-", text.lower()).strip("-")[:60]
+    return f"{base}-{hashlib.sha1(text.encode()).hexdigest()[:6]}"
+
+
+def _digest(*parts: Any) -> str:
+    h = hashlib.sha256(RENDER_VERSION.encode())
+    for part in parts:
+        if isinstance(part, pd.DataFrame):
+            h.update(pd.util.hash_pandas_object(part, index=True).to_numpy().tobytes())
+            h.update(repr(list(part.columns)).encode())
+        elif isinstance(part, bytes):
+            h.update(part)
+        else:
+            h.update(json.dumps(part, sort_keys=True, default=str).encode())
+    return h.hexdigest()[:20]
+
+
+def pages(survey: dataset.Survey) -> list[Page]:
+    """One Page per dimension × domain × period, with its input digest."""
+    cube = queries.load_cube(survey)
+    max_share = queries.max_share(survey)
+    years = survey.years
+    out = []
+    for dimension, domain in cube.slices:
+        raw = queries.raw_numbers(survey, dimension, domain)
+        for period in cube.periods:
+            rows = queries.view_rows(survey, dimension, domain, period)
+            kpi = queries.kpi(survey, dimension, domain, period)
+            csv = queries.csv_export(survey, dimension, domain, period)
+            if period == dataset.AVERAGE:
+                label = f"Average of {', '.join(map(str, years))}"
+            else:
+                label = f"{period}, projected" if period in cube.projected else str(period)
+            out.append(Page(
+                path=f"{dimension}/{slug(domain)}/{period}",
+                title=f"{dimension.capitalize()}: {domain}",
+                period_label=label,
+                rows=rows,
+                kpi=kpi,
+                raw=raw,
+                csv=csv,
+                max_share=max_share,
+                digest=_digest(rows, kpi, raw, csv, max_share),
+            ))
+    return out
+
+
+# -----------------------------------------------------------------------------
+# Rendering (worker side)
+# -----------------------------------------------------------------------------
+
+def _write(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile("wb", dir=path.parent, suffix=".tmp", delete=False) as fh:
+        fh.write(data)
+    os.replace(fh.name, path)
+
+
+def _page_html(page: Page) -> str:
+    any_incident, interval = page.kpi["any_incident"], page.kpi["interval"]
+    scripts = "".join(f'<script src="{src}"></script>' for src in VEGA)
+    return f"""<!doctype html>
+<html><head><meta charset="utf-8"><title>{html.escape(page.title)} ({html.escape(page.period_label)})</title>{scripts}</head>
+<body>
+<h2>{html.escape(page.title)}</h2>
+<p><b>Share of enterprises with any incident ({html.escape(page.period_label)})</b>:
+<span style="font-size:48px;font-weight:bold">{any_incident['estimate']:.1f}%</span></p>
+<p>Bounds {any_incident['lower']:.1f}–{any_incident['upper']:.1f}%; 95 % sampling interval
+{interval['any'][0]:.1f}–{interval['any'][1]:.1f}%. Adding up the incident types gives {page.kpi['total']:.1f}%.</p>
+<div id="bar"></div><div id="pie"></div>
+<h3>Raw numbers</h3>
+{page.raw.to_html(na_rep="..", float_format=lambda v: f"{v:g}")}
+<p><a href="raw.csv">Download CSV</a> · <a href="../../../index.html">All views</a></p>
+<script>vegaEmbed("#bar", "bar.vl.json"); vegaEmbed("#pie", "pie.vl.json");</script>
+</body></html>
+"""
+
+
+def render_page(page: Page, out: Path) -> str:
+    """Write one page's files; returns its path."""
+    target = out / page.path
+    bar = charts.to_spec(charts.bar_chart(page.rows, page.max_share))
+    pie = charts.to_spec(charts.pie_chart(page.rows))
+    _write(target / "bar.vl.json", json.dumps(bar).encode())
+    _write(target / "pie.vl.json", json.dumps(pie).encode())
+    _write(target / "raw.csv", page.csv)
+    _write(target / "index.html", _page_html(page).encode())
+    return page.path
+
+
+def _index_html(all_pages: list[Page], version: str) -> str:
+    items = "\n".join(
+        f'<li><a href="{page.path}/index.html">{html.escape(page.title)} ({html.escape(page.period_label)})</a></li>'
+        for page in all_pages
+    )
+    return f"""<!doctype html>
+<html><head><meta charset="utf-8"><title>Swedish Cyber-Incident Statistics</title></head>
+<body><h1>Swedish Cyber-Incident Statistics</h1><p>Data version <code>{version}</code></p>
+<ul>
+{items}
+</ul></body></html>
+"""
+
+
+# -----------------------------------------------------------------------------
+# Build
+# -----------------------------------------------------------------------------
+
+def build(out: Path, workers: int | None = None, force: bool = False, data: Path | None = None) -> dict[str, int]:
+    """Render the changed pages of the site under ``out``; returns rendered / unchanged / removed counts."""
+    survey = dataset.load_survey(data) if data is not None else queries.current_survey()
+    all_pages = pages(survey)
+    manifest_path = out / MANIFEST
+    previous: dict[str, str] = {}
+    if manifest_path.exists() and not force:
+        previous = json.loads(manifest_path.read_text()).get("pages", {})
+
+    todo = [page for page in all_pages if previous.get(page.path) != page.digest or not (out / page.path / "index.html").exists()]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(todo) <= 1:
+        for page in todo:
+            render_page(page, out)
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            list(pool.map(render_page, todo, [out] * len(todo), chunksize=max(1, len(todo) // (4 * workers))))
+
+    current = {page.path: page.digest for page in all_pages}
+    removed = [path for path in previous if path not in current]
+    for path in removed:
+        shutil.rmtree(out / path, ignore_errors=True)
+    _write(out / "index.html", _index_html(all_pages, survey.version).encode())
+    _write(manifest_path, json.dumps({"version": survey.version, "render_version": RENDER_VERSION, "pages": current}, indent=1).encode())
+    return {"rendered": len(todo), "unchanged": len(all_pages) - len(todo), "removed": len(removed)}
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("out", type=Path, help="output directory")
+    parser.add_argument("--workers", type=int, help="worker processes (default: all cores)")
+    parser.add_argument("--force", action="store_true", help="re-render every page")
+    parser.add_argument("--data", type=Path, help="directory with the SCB CSVs (default: SCB_DATA_DIR or next to dataset.py)")
+    args = parser.parse_args(argv)
+    counts = build(args.out, args.workers, args.force, args.data)
+    print(f"{counts['rendered']} rendered, {counts['unchanged']} unchanged, {counts['removed']} removed -> {args.out}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Process-wide, memory-bounded cache for derived global artefacts.
+
+Streamlit re-executes app.py for every session and rerun, but imported modules
+live for the whole server process, so RESOURCES is shared by all sessions.
+Entries are keyed by (name, data version, args): a new data version simply
+misses and the stale entries age out through the LRU/TTL policy.
+"""
+import os
+import sys
+import threading
+from dataclasses import fields, is_dataclass
+from functools import wraps
+from typing import Any, Callable
+
+import numpy as np
+import pandas as pd
+from cachetools import TTLCache
+
+MAX_BYTES = int(os.environ.get("SCB_CACHE_MAX_BYTES", 512 * 1024**2))
+TTL_SECONDS = float(os.environ.get("SCB_CACHE_TTL", 24 * 3600))
+
+
+def sizeof(value: Any) -> int:
+    """Approximate in-memory size of a cached value in bytes."""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        usage = value.memory_usage(deep=True, index=True)
+        return int(usage.sum() if isinstance(usage, pd.Series) else usage)
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    if is_dataclass(value) and not isinstance(value, type):
+        return sum(sizeof(getattr(value, f.name)) for f in fields(value))
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(sizeof(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(sizeof(v) for v in value)
+    return sys.getsizeof(value)
+
+
+class ResourceCache:
+    """Thread-safe LRU/TTL cache bounded by total bytes, with hit/miss counters."""
+
+    def __init__(self, max_bytes: int = MAX_BYTES, ttl: float = TTL_SECONDS):
+        self._cache: TTLCache = TTLCache(maxsize=max_bytes, ttl=ttl, getsizeof=sizeof)
+        self._lock = threading.RLock()
+        self._building: dict[tuple, threading.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, key: tuple) -> tuple[bool, Any]:
+        with self._lock:
+            try:
+                value = self._cache[key]
+            except KeyError:
+                return False, None
+            self.hits += 1
+            return True, value
+
+    def get_or_build(self, name: str, version: str, build: Callable[[], Any], *args: Any) -> Any:
+        """Return the cached value for (name, version, *args), building it at most once."""
+        key = (name, version, *args)
+        found, value = self._lookup(key)
+        if found:
+            return value
+        with self._lock:
+            build_lock = self._building.setdefault(key, threading.Lock())
+        # One builder per key; concurrent sessions wait for it instead of
+        # producing duplicate copies of the same artefact.
+        with build_lock:
+            found, value = self._lookup(key)
+            if found:
+                return value
+            with self._lock:
+                self.misses += 1
+            try:
+                value = build()
+                with self._lock:
+                    try:
+                        self._cache[key] = value
+                    except ValueError:
+                        pass  # larger than the whole budget: serve it uncached
+            finally:
+                with self._lock:
+                    self._building.pop(key, None)
+        return value
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._cache),
+                "bytes": int(self._cache.currsize),
+                "max_bytes": int(self._cache.maxsize),
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+            self.hits = self.misses = 0
+
+
+RESOURCES = ResourceCache()
+
+
+def memoize(name: str, cache: ResourceCache = RESOURCES):
+    """Cache ``fn(source, *args)`` per ``source.version`` (a Survey, Cube, ...) and hashable args."""
+
+    def decorator(fn: Callable) -> Callable:
+        @wraps(fn)
+        def wrapper(source: Any, *args: Any) -> Any:
+            return cache.get_or_build(name, source.version, lambda: fn(source, *args), *args)
+
+        return wrapper
+
+    return decorator
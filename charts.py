@@ -0,0 +1,240 @@
+"""Chart builders for the dashboard and a cache of finished Vega-Lite specs.
+
+Building an Altair chart serialises its DataFrame into the spec and validates
+the result against the Vega-Lite JSON schema, which is one of the most
+expensive steps of a rerun. Finished specs are therefore cached in the shared
+RESOURCES cache keyed by (kind, data version, selection), and optionally
+persisted as JSON under SCB_SPEC_DIR so restarts and replicas reuse them.
+Cached specs are rendered with st.vega_lite_chart, skipping Altair entirely.
+
+v24: builders pass only the columns they encode, and cached specs carry
+their datasets as Arrow IPC bytes, which st.vega_lite_chart forwards to the
+browser untouched instead of re-encoding row-oriented JSON on every rerun.
+Each spec records its payload size (Arrow and the equivalent inline JSON)
+under ``usermeta``, and TRANSPORT keeps the latest size and timings per
+chart kind.
+
+v25: sorting, top-N truncation and binning happen server-side in NumPy
+(transforms.py) before Altair sees the data, so a spec holds at most
+BAR_TOP_N / PIE_TOP_N rows plus an "Other" row, or HIST_BINS bins, however
+large the view. The charts keep the data order instead of sorting in Vega.
+"""
+import base64
+import hashlib
+import json
+import os
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable
+
+import altair as alt
+import pandas as pd
+import numpy as np
+import pyarrow as pa
+
+from cache import RESOURCES
+from cube import ESTIMATED, PROJECTED, REPORTED, UNAVAILABLE
+from transforms import OTHER, histogram, sort_desc, top_n
+
+SPEC_DIR = Path(os.environ["SCB_SPEC_DIR"]) if os.environ.get("SCB_SPEC_DIR") else None
+# Part of the persisted file name: bump when the cached spec layout changes.
+SPEC_FORMAT = "arrow2"
+
+BAR_FIELDS = ["incident_type", "current_share_filled", "current_moe", "status"]
+PIE_FIELDS = ["incident_type", "current_share_filled"]
+DELTA_FIELDS = ["domain", "incident_type", "delta"]
+BAR_TOP_N = 15  # the rest become one "Other" bar at their mean share
+PIE_TOP_N = 8  # the rest become one "Other" slice with their summed share
+HIST_BINS = 40
+
+
+# -----------------------------------------------------------------------------
+# Builders
+# -----------------------------------------------------------------------------
+
+def bar_chart(df_sel: pd.DataFrame, max_share: float) -> alt.Chart:
+    # v4: fixed X‑axis scale using overall MAX_SHARE
+    # v25: sorted and truncated server-side; Vega keeps the row order
+    rows = top_n(
+        df_sel[BAR_FIELDS], "incident_type", "current_share_filled", BAR_TOP_N, how="mean", fill={"status": OTHER}
+    )
+    return (
+        alt.Chart(rows)
+        .mark_bar()
+        .encode(
+            y=alt.Y("incident_type:N", sort=None, title="Incident type"),
+            x=alt.X(
+                "current_share_filled:Q",
+                title="Share (%)",
+                scale=alt.Scale(domain=[0, max_share + 1]),  # v4 fixed scale
+            ),
+            color=alt.Color(
+                "status:N",
+                # v18: suppressed cells are estimated from their parent domain
+                scale=alt.Scale(
+                    domain=[REPORTED, ESTIMATED, PROJECTED, UNAVAILABLE, OTHER],
+                    range=["#1f77b4", "#9ecae1", "#ff7f0e", "#cccccc", "#7f7f7f"],
+                ),
+                legend=alt.Legend(title=""),
+            ),
+            tooltip=[
+                "incident_type:N",
+                alt.Tooltip("current_share_filled:Q", title="Share (%)", format=".1f"),
+                alt.Tooltip("current_moe:Q", title="± (pp)", format=".1f"),
+                "status:N",
+            ],
+        )
+        .properties(height=400)
+    )
+
+
+def pie_chart(df_sel: pd.DataFrame) -> alt.Chart:
+    # Pie chart – reported and estimated shares, never the placeholder fill
+    shown = df_sel.loc[df_sel["status"] != UNAVAILABLE, PIE_FIELDS]
+    rows = top_n(shown, "incident_type", "current_share_filled", PIE_TOP_N)
+    return (
+        alt.Chart(rows)
+        .mark_arc()
+        .encode(
+            theta="current_share_filled:Q",
+            color="incident_type:N",
+            tooltip=["incident_type", "current_share_filled"],
+        )
+        .properties(height=300)
+    )
+
+
+def delta_bar(abs_top5: pd.DataFrame) -> alt.Chart:
+    return (
+        alt.Chart(sort_desc(abs_top5[DELTA_FIELDS], "delta"))
+        .mark_bar()
+        .encode(
+            y=alt.Y("incident_type:N", sort=None, title=""),
+            x=alt.X("delta:Q", title="Δ (pp)"),
+            color=alt.condition(alt.datum.delta > 0, alt.value("#d62728"), alt.value("#1f77b4")),
+            tooltip=["domain", "incident_type", "delta"],
+        )
+        .properties(height=300)
+    )
+
+
+def change_histogram(delta: np.ndarray) -> alt.Chart:
+    # v25: distribution of every series' change, binned before it reaches the spec
+    return (
+        alt.Chart(histogram(delta, HIST_BINS))
+        .mark_bar()
+        .encode(
+            x=alt.X("bin_start:Q", title="Δ (pp)"),
+            x2="bin_end:Q",
+            y=alt.Y("count:Q", title="Series"),
+            tooltip=[
+                alt.Tooltip("bin_start:Q", title="From", format=".1f"),
+                alt.Tooltip("bin_end:Q", title="To", format=".1f"),
+                "count:Q",
+            ],
+        )
+        .properties(height=200)
+    )
+
+
+# -----------------------------------------------------------------------------
+# Spec cache
+# -----------------------------------------------------------------------------
+
+def to_spec(chart: alt.Chart) -> dict[str, Any]:
+    """Validated Vega-Lite dict with inline data, using the theme Streamlit applies itself."""
+    with alt.theme.enable("none"), alt.data_transformers.enable("default", max_rows=None):
+        return chart.to_dict()
+
+
+def _arrow(values: list[dict[str, Any]]) -> bytes:
+    sink = pa.BufferOutputStream()
+    table = pa.Table.from_pylist(values)
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def to_arrow_spec(chart: alt.Chart) -> dict[str, Any]:
+    """Like to_spec, with every dataset as Arrow IPC bytes and its payload sizes in ``usermeta``."""
+    spec = to_spec(chart)
+    datasets = spec.get("datasets", {})
+    spec["usermeta"] = {
+        "json_bytes": sum(len(json.dumps(values, separators=(",", ":"))) for values in datasets.values()),
+        "rows": sum(len(values) for values in datasets.values()),
+    }
+    spec["datasets"] = {name: _arrow(values) for name, values in datasets.items()}
+    spec["usermeta"]["arrow_bytes"] = sum(len(data) for data in spec["datasets"].values())
+    return spec
+
+
+@dataclass
+class Transport:
+    """Latest payload and timings of one chart kind, for the About section."""
+
+    rows: int = 0
+    arrow_bytes: int = 0
+    json_bytes: int = 0
+    build_ms: float = float("nan")  # Altair build + validation + Arrow encoding, on the last cache miss
+    render_ms: float = float("nan")  # spec lookup + st.vega_lite_chart marshalling, on the last render
+
+
+TRANSPORT: dict[str, Transport] = {}
+
+
+def record_render(kind: str, spec: dict[str, Any], seconds: float) -> None:
+    """Note the payload and server-side render time of one chart just sent."""
+    stats = TRANSPORT.setdefault(kind, Transport())
+    meta = spec.get("usermeta", {})
+    stats.rows = meta.get("rows", 0)
+    stats.arrow_bytes = meta.get("arrow_bytes", 0)
+    stats.json_bytes = meta.get("json_bytes", 0)
+    stats.render_ms = seconds * 1000.0
+
+
+def _spec_path(kind: str, version: str, key: tuple) -> Path:
+    digest = hashlib.sha1(json.dumps([SPEC_FORMAT, kind, *map(str, key)]).encode()).hexdigest()[:16]
+    return SPEC_DIR / version / f"{kind}-{digest}.json"
+
+
+def _dump(spec: dict[str, Any]) -> str:
+    datasets = {name: base64.b64encode(data).decode() for name, data in spec.get("datasets", {}).items()}
+    return json.dumps({**spec, "datasets": datasets})
+
+
+def _load(text: str) -> dict[str, Any]:
+    spec = json.loads(text)
+    spec["datasets"] = {name: base64.b64decode(data) for name, data in spec.get("datasets", {}).items()}
+    return spec
+
+
+def _load_or_build(kind: str, version: str, key: tuple, build: Callable[[], alt.Chart]) -> dict[str, Any]:
+    path = _spec_path(kind, version, key) if SPEC_DIR else None
+    if path is not None and path.exists():
+        return _load(path.read_text())
+    started = time.perf_counter()
+    spec = to_arrow_spec(build())
+    TRANSPORT.setdefault(kind, Transport()).build_ms = (time.perf_counter() - started) * 1000.0
+    if path is not None:
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with tempfile.NamedTemporaryFile("w", dir=path.parent, suffix=".tmp", delete=False) as fh:
+                fh.write(_dump(spec))
+            os.replace(fh.name, path)
+        except OSError:
+            pass  # persistence is best effort; the in-memory entry still serves
+    return spec
+
+
+def cached_spec(kind: str, version: str, key: tuple, build: Callable[[], alt.Chart]) -> dict[str, Any]:
+    """Finished spec for chart ``kind`` at ``key`` (e.g. dimension, domain, year).
+
+    ``build`` is only called on a miss in both the memory and disk caches. The
+    returned dict is shared; st.vega_lite_chart copies it before moving the
+    Arrow datasets into its message.
+    """
+    return RESOURCES.get_or_build(
+        f"spec:{kind}", version, lambda: _load_or_build(kind, version, key, build), *key
+    )
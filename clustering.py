@@ -0,0 +1,214 @@
+"""Groups of domains with similar incident mixes.
+
+Every view (industry, region or size domain) is a vector of its per-type
+shares for one period, taken from the cube, so suppressed cells hold their
+estimates. Vectors are scaled to unit length, which makes the cosine
+distance 1 - x·y and compares mixes rather than levels: a region with twice
+the incidents of another but in the same proportions sits at distance 0.
+
+Clustering is spherical k-means (k-means on the unit sphere, centroids
+renormalised after each update), seeded k-means++ style and restarted
+N_INIT times. k is picked by mean silhouette over 2..MAX_K. For unit
+vectors the mean cosine distance from x to a cluster is 1 - x·mean(cluster),
+so the exact silhouette costs O(n·k), not O(n²).
+
+Anything pairwise (assignment, nearest neighbours) is computed in row blocks
+of BLOCK, so memory stays at BLOCK × n however many domains there are.
+"""
+from dataclasses import dataclass
+from typing import Iterator
+
+import numpy as np
+
+import dataset
+from cube import Cube, view_matrix
+
+MAX_K = 8
+N_INIT = 10
+MAX_ITER = 100
+NEIGHBOURS = 3
+BLOCK = 1024
+
+
+@dataclass(frozen=True)
+class Clusters:
+    version: str
+    period: int | str
+    views: list[tuple[str, str]]  # (dimension, domain) per row
+    incident_types: list[str]
+    labels: np.ndarray  # (n_views,) cluster per view, -1 for views without any share
+    centroids: np.ndarray  # (k, n_types) unit-length mean direction
+    profiles: np.ndarray  # (k, n_types) mean shares of the members, in %
+    silhouette: float
+    neighbours: np.ndarray  # (n_views, NEIGHBOURS) most similar other views, -1 if fewer
+    similarity: np.ndarray  # (n_views, NEIGHBOURS) their cosine similarity
+
+    @property
+    def k(self) -> int:
+        return len(self.centroids)
+
+    def members(self, cluster: int) -> list[tuple[str, str]]:
+        return [self.views[i] for i in np.flatnonzero(self.labels == cluster)]
+
+    def similar(self, dimension: str, domain: str) -> list[tuple[tuple[str, str], float]]:
+        """The most similar other views of one view, with their cosine similarity."""
+        row = self.views.index((dimension, domain))
+        return [
+            (self.views[j], float(s))
+            for j, s in zip(self.neighbours[row], self.similarity[row])
+            if j >= 0
+        ]
+
+
+def unit_rows(values: np.ndarray) -> np.ndarray:
+    """Rows scaled to unit length; all-zero rows stay zero."""
+    norm = np.linalg.norm(values, axis=1, keepdims=True)
+    return np.divide(values, norm, out=np.zeros_like(values), where=norm > 0)
+
+
+def blocks(n: int, size: int = BLOCK) -> Iterator[slice]:
+    for lo in range(0, n, size):
+        yield slice(lo, min(lo + size, n))
+
+
+def assign(x: np.ndarray, centroids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Nearest centroid per row by cosine similarity, and that similarity."""
+    labels = np.empty(len(x), dtype=np.intp)
+    best = np.empty(len(x))
+    for rows in blocks(len(x)):
+        sim = x[rows] @ centroids.T
+        labels[rows] = sim.argmax(axis=1)
+        best[rows] = sim[np.arange(len(sim)), labels[rows]]
+    return labels, best
+
+
+def nearest(x: np.ndarray, k: int = NEIGHBOURS) -> tuple[np.ndarray, np.ndarray]:
+    """The ``k`` most similar other rows of each row (blocked pairwise cosine)."""
+    n = len(x)
+    k_eff = min(k, n - 1)
+    index = np.full((n, k), -1, dtype=np.intp)
+    sim_out = np.full((n, k), np.nan)
+    if k_eff <= 0:
+        return index, sim_out
+    for rows in blocks(n):
+        sim = x[rows] @ x.T
+        sim[np.arange(len(sim)), np.arange(rows.start, rows.stop)] = -np.inf
+        top = np.argpartition(-sim, k_eff - 1, axis=1)[:, :k_eff]
+        top_sim = np.take_along_axis(sim, top, axis=1)
+        order = np.argsort(-top_sim, axis=1)
+        index[rows, :k_eff] = np.take_along_axis(top, order, axis=1)
+        sim_out[rows, :k_eff] = np.take_along_axis(top_sim, order, axis=1)
+    return index, sim_out
+
+
+def _seed(x: np.ndarray, k: int, rng: np.random.Generator) -> np.ndarray:
+    """k-means++ on cosine distance."""
+    centres = [int(rng.integers(len(x)))]
+    dist = 1.0 - x @ x[centres[0]]
+    for _ in range(1, k):
+        weights = np.maximum(dist, 0.0)
+        total = weights.sum()
+        nxt = int(rng.choice(len(x), p=weights / total)) if total > 0 else int(rng.integers(len(x)))
+        centres.append(nxt)
+        dist = np.minimum(dist, 1.0 - x @ x[nxt])
+    return x[centres].copy()
+
+
+def spherical_kmeans(x: np.ndarray, k: int, seed: int = 0, n_init: int = N_INIT) -> tuple[np.ndarray, np.ndarray, float]:
+    """Labels, unit centroids and total within-cluster cosine distance of the best restart."""
+    rng = np.random.default_rng(seed)
+    best: tuple[np.ndarray, np.ndarray, float] | None = None
+    for _ in range(n_init):
+        centroids = _seed(x, k, rng)
+        labels = np.full(len(x), -1, dtype=np.intp)
+        for _ in range(MAX_ITER):
+            new, sim = assign(x, centroids)
+            if np.array_equal(new, labels):
+                break
+            labels = new
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, x)
+            empty = ~sums.any(axis=1)
+            if empty.any():
+                # restart empty clusters at the worst-fitting rows
+                sums[empty] = x[np.argsort(sim)[: empty.sum()]]
+            centroids = unit_rows(sums)
+        cost = float((1.0 - sim).sum())
+        if best is None or cost < best[2]:
+            best = (labels, centroids, cost)
+    return best
+
+
+def silhouette(x: np.ndarray, labels: np.ndarray, k: int) -> float:
+    """Mean silhouette under cosine distance, from per-cluster sums in O(n·k)."""
+    counts = np.bincount(labels, minlength=k).astype(np.float64)
+    sums = np.zeros((k, x.shape[1]))
+    np.add.at(sums, labels, x)
+    a = np.empty(len(x))
+    b = np.empty(len(x))
+    for rows in blocks(len(x)):
+        dots = x[rows] @ sums.T  # (block, k) sum of similarities to each cluster
+        own = labels[rows]
+        at = np.arange(len(dots))
+        n_own = counts[own] - 1  # excluding the point itself (similarity 1)
+        a[rows] = np.where(n_own > 0, 1.0 - (dots[at, own] - 1.0) / np.maximum(n_own, 1), 0.0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            other = 1.0 - dots / counts
+        other[at, own] = np.inf
+        other[:, counts == 0] = np.inf
+        b[rows] = other.min(axis=1)
+    with np.errstate(invalid="ignore"):
+        s = np.where(counts[labels] > 1, (b - a) / np.maximum(a, b), 0.0)
+    return float(np.nan_to_num(s).mean())
+
+
+def build_clusters(survey: dataset.Survey, cube: Cube, period: int | str, k: int | None = None, seed: int = 0) -> Clusters:
+    """Cluster every view's incident mix for one period; ``k`` is chosen by silhouette if None."""
+    views = list(cube.slices)
+    kinds = list(survey.table["incident_type"].cat.categories)
+    shares = np.nan_to_num(view_matrix(cube.estimate[:, cube.column(period)], survey))  # (n_views, n_types)
+    x = unit_rows(shares)
+    usable = np.flatnonzero(x.any(axis=1))
+    xu = x[usable]
+
+    candidates = [k] if k is not None else list(range(2, min(MAX_K, len(xu) - 1) + 1))
+    best: tuple[float, np.ndarray, np.ndarray] | None = None
+    for n_clusters in candidates:
+        if n_clusters < 1 or n_clusters > len(xu):
+            continue
+        labels, centroids, _ = spherical_kmeans(xu, n_clusters, seed)
+        score = silhouette(xu, labels, n_clusters) if n_clusters > 1 else 0.0
+        if best is None or score > best[0]:
+            best = (score, labels, centroids)
+    if best is None:  # fewer than two usable views
+        best = (0.0, np.zeros(len(xu), dtype=np.intp), xu[:1].copy())
+
+    score, labels, centroids = best
+    order = np.argsort(-np.bincount(labels, minlength=len(centroids)), kind="stable")  # largest cluster first
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    full = np.full(len(views), -1, dtype=np.intp)
+    full[usable] = rank[labels]
+    centroids = centroids[order]
+    counts = np.bincount(full[usable], minlength=len(centroids))
+    profiles = np.zeros_like(centroids)
+    np.add.at(profiles, full[usable], shares[usable])
+    profiles /= np.maximum(counts, 1)[:, None]
+
+    neighbours = np.full((len(views), NEIGHBOURS), -1, dtype=np.intp)
+    similarity = np.full((len(views), NEIGHBOURS), np.nan)
+    near, sim = nearest(xu)
+    neighbours[usable] = np.where(near >= 0, usable[np.maximum(near, 0)], -1)
+    similarity[usable] = sim
+    return Clusters(
+        version=cube.version,
+        period=period,
+        views=views,
+        incident_types=kinds,
+        labels=full,
+        centroids=centroids,
+        profiles=profiles,
+        silhouette=score,
+        neighbours=neighbours,
+        similarity=similarity,
+    )
@@ -0,0 +1,142 @@
+"""Materialized metrics cube for every dimension × domain × year view.
+
+Built once per data version from a dataset.Survey. Rows line up with
+``Survey.table`` (one row per series), columns are the selectable periods
+(each survey wave, "Average", then the projected waves), so a view is a row
+slice × one column and reruns only read precomputed arrays.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+import dataset
+import incidence
+from forecast import project
+from imputation import impute
+
+# v3: missing data is drawn as a thin grey bar instead of a 0 % one; since v18
+# only cells that cannot be estimated from a parent domain or another wave.
+UNAVAILABLE_FILL = 0.1
+REPORTED = "Reported"
+ESTIMATED = "Estimated"
+PROJECTED = "Projected"
+UNAVAILABLE = "Data unavailable"
+
+
+@dataclass(frozen=True)
+class Cube:
+    version: str
+    periods: list[int | str]
+    projected: list[int]  # the trailing periods that are trend projections
+    share: np.ndarray  # (n_series, n_periods) float32, NaN where not reported
+    estimate: np.ndarray  # share with suppressed cells estimated, NaN where that is impossible too
+    moe: np.ndarray  # 95 % margin of ``estimate``, percentage points
+    filled: np.ndarray  # estimate with NaN -> UNAVAILABLE_FILL
+    status: np.ndarray  # (n_series, n_periods) REPORTED / ESTIMATED / PROJECTED / UNAVAILABLE labels
+    totals: np.ndarray  # (n_views, n_periods) sum of reported and estimated shares
+    union: dict[str, np.ndarray]  # lower / upper / independent / estimate, (n_views, n_periods) in %
+    correlated: bool  # estimate adjusted for supplied co-occurrence data
+    slices: dict[tuple[str, str], slice]
+    positions: dict[tuple[str, str], int]
+
+    def column(self, period: int | str) -> int:
+        return self.periods.index(period)
+
+    def frame(self, dimension: str, domain: str, period: int | str) -> pd.DataFrame:
+        """current_share / current_share_filled / current_moe / status for one view, indexed like Survey.view."""
+        rows = self.slices[(dimension, domain)]
+        col = self.column(period)
+        return pd.DataFrame(
+            {
+                "current_share": self.share[rows, col],
+                "current_share_filled": self.filled[rows, col],
+                "current_moe": self.moe[rows, col],
+                "status": self.status[rows, col],
+            },
+            index=pd.RangeIndex(rows.start, rows.stop),
+        )
+
+    def total(self, dimension: str, domain: str, period: int | str) -> float:
+        """Sum of the per-type shares for one view, estimates included (double-counts overlaps)."""
+        return float(self.totals[self.positions[(dimension, domain)], self.column(period)])
+
+    def any_incident(self, dimension: str, domain: str, period: int | str) -> dict[str, float]:
+        """Share of enterprises with at least one incident type: estimate and bounds, in %."""
+        at = (self.positions[(dimension, domain)], self.column(period))
+        return {name: float(values[at]) for name, values in self.union.items()}
+
+
+def view_matrix(values: np.ndarray, survey: dataset.Survey) -> np.ndarray:
+    """Scatter per-series rows (n_series, ...) into a dense (n_views, ..., n_types) array.
+
+    Views lacking an incident type get NaN in that slot.
+    """
+    slices = survey.selections()
+    lengths = np.fromiter((s.stop - s.start for s in slices.values()), dtype=np.intp, count=len(slices))
+    view = np.repeat(np.arange(len(slices)), lengths)
+    kind = survey.table["incident_type"].cat.codes.to_numpy()
+    n_types = len(survey.table["incident_type"].cat.categories)
+    dense = np.full((len(slices), *values.shape[1:], n_types), np.nan, dtype=np.float64)
+    dense[view, ..., kind] = values
+    return dense
+
+
+def build_cube(survey: dataset.Survey, correlation: np.ndarray | None = None) -> Cube:
+    """Compute every view's metrics in one vectorized pass over the wide table.
+
+    ``correlation`` is an optional incident-type correlation matrix (in the
+    order of the incident_type categories) used for the any-incident estimate.
+    Suppressed cells are estimated first (imputation.impute); totals, unions
+    and the risk model downstream use those estimates. v19: the upcoming
+    waves are appended as trend projections (forecast.project).
+    """
+    years = survey.years
+    by_year = survey.table[[f"share_{year}" for year in years]].to_numpy(dtype=np.float32)
+    imputed = impute(survey)
+    projection = project(survey, imputed)
+    periods: list[int | str] = [*years, dataset.AVERAGE, *projection.years]
+
+    # Average mode: mean over the waves that are reported (all-NaN stays NaN);
+    # series never reported average their estimates instead.
+    reported = ~np.isnan(by_year)
+    counts = reported.sum(axis=1)
+    known = ~np.isnan(imputed.share)
+    use = np.where((counts > 0)[:, None], reported, known)
+    n_used = use.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        average = np.where(counts > 0, np.nansum(by_year, axis=1) / counts, np.nan).astype(np.float32)
+        average_estimate = np.where(use, imputed.share, 0).sum(axis=1) / n_used
+        average_moe = np.sqrt(np.where(use, np.square(imputed.moe), 0).sum(axis=1)) / n_used
+    ahead = np.full((len(by_year), len(projection.years)), np.nan, dtype=np.float32)
+    share = np.column_stack([by_year, average, ahead])
+    estimate = np.column_stack([imputed.share, average_estimate, projection.share]).astype(np.float32)
+    moe = np.column_stack([imputed.moe, average_moe, projection.moe]).astype(np.float32)
+
+    missing = np.isnan(estimate)
+    filled = np.where(missing, np.float32(UNAVAILABLE_FILL), estimate)
+    status = np.where(missing, UNAVAILABLE, np.where(np.isnan(share), ESTIMATED, REPORTED)).astype(object)
+    status[:, len(years) + 1:][~missing[:, len(years) + 1:]] = PROJECTED
+
+    slices = survey.selections()
+    starts = np.fromiter((s.start for s in slices.values()), dtype=np.intp, count=len(slices))
+    totals = np.add.reduceat(np.where(missing, 0, estimate), starts, axis=0) if len(starts) else np.empty((0, len(periods)))
+
+    # v12: union of the overlapping incident types, for every view and period
+    union = incidence.any_incident(view_matrix(estimate, survey) / 100.0, correlation)
+
+    return Cube(
+        version=survey.version,
+        periods=periods,
+        projected=projection.years,
+        share=share,
+        estimate=estimate,
+        moe=moe,
+        filled=filled,
+        status=status,
+        totals=totals,
+        union={name: values * 100.0 for name, values in union.items()},
+        correlated=correlation is not None,
+        slices=slices,
+        positions={key: i for i, key in enumerate(slices)},
+    )
@@ -0,0 +1,374 @@
+"""Data layer for the SCB cyber-incident dashboard.
+
+The four SCB extracts are parsed into one tidy, year-indexed table with a row
+per (dimension, domain, incident_type, year). Survey waves are read from the
+CSV headers, so a new wave only means a new pair of columns in the extracts.
+
+Parsing is the expensive part of a cold start, so the first parse is compiled
+into an Arrow IPC snapshot keyed by the content hash of the source files.
+Later starts (and other replicas sharing the snapshot directory) memory-map
+the snapshot instead of parsing text again.
+"""
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+from domains import SizeBands, SniIndex, build_size_bands, build_sni_index
+
+DATA_DIR = Path(__file__).parent
+
+FILES = {
+    "industry": "industry.csv",
+    "region": "regions.csv",
+    "size_s": "S-enterprises.csv",
+    "size_ml": "M-L-enterprises.csv",
+}
+
+# Dashboard dimension each extract belongs to; small and medium/large
+# enterprises are two halves of the size breakdown.
+DIMENSION_OF = {
+    "industry": "industry",
+    "region": "region",
+    "size_s": "size",
+    "size_ml": "size",
+}
+
+# Header text -> column name for the label columns. The two label columns
+# repeat heavily and are stored as categoricals so filtering compares integer
+# codes instead of strings.
+LABELS = {
+    "type of consequences": "incident_type",
+    "study domain": "domain",
+}
+LABEL_DTYPE = "category"
+
+# One share and one margin-of-error column per survey wave. Shares and margins
+# are whole percents, so float32 is exact.
+VALUE_PATTERNS = {
+    "share": re.compile(r"share of enterprises, percent (\d{4})$"),
+    "moe": re.compile(r"margin of error, .*?(\d{4})$"),
+}
+VALUE_DTYPE = "float32"
+VALUES = list(VALUE_PATTERNS)
+
+KEYS = ["dimension", "domain", "incident_type"]
+CATEGORICALS = ["dimension", "incident_type", "domain"]
+
+# Pseudo-year for the mean over every survey wave.
+AVERAGE = "Average"
+
+# SCB marks suppressed cells (too few respondents) with "..".
+NA_MARKER = ".."
+
+# Bump whenever the parsed layout changes so stale snapshots are ignored.
+SCHEMA_VERSION = "4"
+
+
+def data_dir() -> Path:
+    """Directory holding the SCB extracts (SCB_DATA_DIR, default: next to this module)."""
+    return Path(os.environ.get("SCB_DATA_DIR", DATA_DIR))
+
+
+def snapshot_dir() -> Path:
+    """Directory for compiled snapshots (SCB_SNAPSHOT_DIR, default: <data dir>/.snapshots)."""
+    return Path(os.environ.get("SCB_SNAPSHOT_DIR", data_dir() / ".snapshots"))
+
+
+def source_paths(directory: Path | None = None) -> dict[str, Path]:
+    """Resolve the source CSV paths, raising FileNotFoundError for any that are missing."""
+    directory = Path(directory) if directory is not None else data_dir()
+    paths = {key: directory / fname for key, fname in FILES.items()}
+    for key, path in paths.items():
+        if not path.exists():
+            raise FileNotFoundError(FILES[key])
+    return paths
+
+
+def data_version(paths: dict[str, Path]) -> str:
+    """Content hash of the source files (plus the schema version)."""
+    stamp = tuple((str(path), path.stat().st_mtime_ns, path.stat().st_size) for path in paths.values())
+    if stamp in _VERSIONS:
+        return _VERSIONS[stamp]
+    _VERSIONS[stamp] = version = _hash_sources(paths)
+    return version
+
+
+# (path, mtime, size) of every source -> content hash, so unchanged files are
+# not re-hashed on every rerun.
+_VERSIONS: dict[tuple, str] = {}
+
+
+def _hash_sources(paths: dict[str, Path]) -> str:
+    digest = hashlib.sha256(SCHEMA_VERSION.encode())
+    for key, path in paths.items():
+        digest.update(key.encode())
+        with open(path, "rb") as fh:
+            digest.update(hashlib.file_digest(fh, "sha256").digest())
+    return digest.hexdigest()[:16]
+
+
+# -----------------------------------------------------------------------------
+# Parsing
+# -----------------------------------------------------------------------------
+
+def schema(header: list[str]) -> dict[str, tuple[str, str]]:
+    """Map each raw header to its (column name, dtype), e.g. '... percent 2023' -> share_2023."""
+    out: dict[str, tuple[str, str]] = {}
+    for raw in header:
+        text = raw.strip()
+        if text in LABELS:
+            out[raw] = (LABELS[text], LABEL_DTYPE)
+            continue
+        for value, pattern in VALUE_PATTERNS.items():
+            match = pattern.search(text)
+            if match:
+                out[raw] = (f"{value}_{match.group(1)}", VALUE_DTYPE)
+                break
+        else:
+            raise ValueError(f"Unrecognised SCB column header: {raw!r}")
+    return out
+
+
+def parse_csv(path: Path) -> pd.DataFrame:
+    """Parse one SCB extract straight into typed wide columns in a single pass."""
+    read = dict(sep=";", encoding="cp1252", skiprows=1, header=0)
+    cols = schema(list(pd.read_csv(path, nrows=0, **read).columns))
+    df = pd.read_csv(
+        path,
+        dtype={raw: dtype for raw, (_, dtype) in cols.items()},
+        # blank numeric cells are missing too, as they were with to_numeric(errors="coerce")
+        na_values={
+            raw: [NA_MARKER, ""] if dtype == VALUE_DTYPE else [NA_MARKER] for raw, (_, dtype) in cols.items()
+        },
+        keep_default_na=False,
+        **read,
+    )
+    return df.rename(columns={raw: name for raw, (name, _) in cols.items()})
+
+
+# -----------------------------------------------------------------------------
+# Pivot / unpivot between the SCB wide layout and the long store
+# -----------------------------------------------------------------------------
+
+def wave_years(columns) -> list[int]:
+    """Survey years present in a wide frame's share_<year> columns."""
+    return sorted({int(col.split("_", 1)[1]) for col in columns if col.startswith("share_")})
+
+
+def wide_columns(years: list[int]) -> list[str]:
+    """Value columns of the wide layout, grouped as share_* then moe_* like the SCB files."""
+    return [f"{value}_{year}" for value in VALUES for year in years]
+
+
+def to_long(wide: pd.DataFrame, **labels: str) -> pd.DataFrame:
+    """Unpivot share_<year>/moe_<year> columns into one row per year.
+
+    Keyword arguments add constant label columns (e.g. dimension="size").
+    """
+    years = wave_years(wide.columns)
+    n, k = len(wide), len(years)
+    rows = np.repeat(np.arange(n), k)
+    out = {
+        name: pd.Categorical.from_codes(np.zeros(n * k, dtype=np.int8), [value])
+        for name, value in labels.items()
+    }
+    for col in wide.columns.intersection(["incident_type", "domain"]):
+        out[col] = wide[col].iloc[rows].reset_index(drop=True)
+    out["year"] = np.tile(np.asarray(years, dtype=np.int16), n)
+    for value in VALUES:
+        cols = wide.reindex(columns=[f"{value}_{year}" for year in years])
+        out[value] = cols.to_numpy(dtype=VALUE_DTYPE).ravel()
+    return pd.DataFrame(out)
+
+
+def to_wide(long: pd.DataFrame) -> pd.DataFrame:
+    """Pivot a long frame back to one row per series with share_<year>/moe_<year> columns.
+
+    Rows keep the order in which series first appear in ``long``.
+    """
+    keys = [col for col in KEYS if col in long.columns]
+    order = long[keys].drop_duplicates()
+    wide = long.pivot(index=keys, columns="year", values=VALUES)
+    wide.columns = [f"{value}_{year}" for value, year in wide.columns]
+    wide = wide.reindex(pd.MultiIndex.from_frame(order))
+    cols = wide_columns(wave_years(wide.columns))
+    return wide[cols].reset_index()
+
+
+# -----------------------------------------------------------------------------
+# Long-format store
+# -----------------------------------------------------------------------------
+
+def block_index(frame: pd.DataFrame) -> dict[tuple[str, str], slice]:
+    """Map each (dimension, domain) to its contiguous row slice in a frame sorted by both."""
+    if frame.empty:
+        return {}
+    dim = frame["dimension"].cat.codes.to_numpy()
+    dom = frame["domain"].cat.codes.to_numpy()
+    edges = np.flatnonzero((dim[1:] != dim[:-1]) | (dom[1:] != dom[:-1])) + 1
+    starts = np.r_[0, edges]
+    stops = np.r_[edges, len(frame)]
+    dims = frame["dimension"].to_numpy()[starts]
+    doms = frame["domain"].to_numpy()[starts]
+    return {
+        (str(d), str(m)): slice(int(a), int(b))
+        for d, m, a, b in zip(dims, doms, starts, stops)
+    }
+
+
+@dataclass(frozen=True)
+class Survey:
+    """Tidy year-indexed store: one row per (dimension, domain, incident_type, year).
+
+    ``long`` must be grouped by (dimension, domain), as build_long leaves it.
+    The wide table and the per-selection row slices are derived once here, so
+    selecting a view is a dictionary lookup plus a zero-copy ``iloc`` slice.
+    ``sni`` indexes the SNI coverage of the industry domains and ``sizes``
+    the head-count hierarchy of the size domains.
+    """
+
+    long: pd.DataFrame
+    version: str
+    table: pd.DataFrame = field(init=False, repr=False)
+    _rows: dict[tuple[str, str], slice] = field(init=False, repr=False)
+    _views: dict[tuple[str, str], slice] = field(init=False, repr=False)
+    _domains: dict[str, list[str]] = field(init=False, repr=False)
+    sni: SniIndex = field(init=False, repr=False)
+    sizes: SizeBands = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        table = to_wide(self.long)
+        views = block_index(table)
+        domains: dict[str, list[str]] = {}
+        for dim, dom in views:
+            domains.setdefault(dim, []).append(dom)
+        object.__setattr__(self, "table", table)
+        object.__setattr__(self, "_rows", block_index(self.long))
+        object.__setattr__(self, "_views", views)
+        object.__setattr__(self, "_domains", {dim: sorted(doms) for dim, doms in domains.items()})
+        object.__setattr__(self, "sni", build_sni_index(self.domains("industry")))
+        object.__setattr__(self, "sizes", build_size_bands(self.domains("size")))
+
+    @property
+    def years(self) -> list[int]:
+        return sorted(int(year) for year in self.long["year"].unique())
+
+    def domains(self, dimension: str) -> list[str]:
+        """Sorted domain labels available for a dimension."""
+        return self._domains.get(dimension, [])
+
+    def selections(self) -> dict[tuple[str, str], slice]:
+        """Every (dimension, domain) selection and its row slice in ``table``, in table order."""
+        return dict(self._views)
+
+    def rows(self, dimension: str, domain: str) -> pd.DataFrame:
+        """Long rows of one (dimension, domain) selection, as a slice of ``long``."""
+        return self.long.iloc[self._rows[(dimension, domain)]]
+
+    def view(self, dimension: str, domain: str) -> pd.DataFrame:
+        """Wide rows of one (dimension, domain) selection, as a slice of ``table``."""
+        return self.table.iloc[self._views[(dimension, domain)]]
+
+    def at(self, year: int) -> pd.DataFrame:
+        """Rows for a single survey wave."""
+        return self.long[self.long["year"] == year]
+
+    def wide(self, rows: pd.DataFrame | None = None) -> pd.DataFrame:
+        """Wide share_<year>/moe_<year> view of ``rows`` (default: the whole store)."""
+        return self.table if rows is None else to_wide(rows)
+
+    def delta(self, start: int | None = None, end: int | None = None) -> pd.DataFrame:
+        """Change in share per series between two waves (default: the two latest)."""
+        years = self.years
+        start = years[-2] if start is None else start
+        end = years[-1] if end is None else end
+        # a single wave (start == end) has no change to measure
+        wide = self.table[KEYS + list(dict.fromkeys([f"share_{start}", f"share_{end}"]))].copy()
+        wide["delta"] = wide[f"share_{end}"] - wide[f"share_{start}"] if start != end else np.nan
+        return wide
+
+    def top_changes(self, n: int = 5, start: int | None = None, end: int | None = None) -> pd.DataFrame:
+        """The ``n`` series with the largest absolute change between two waves."""
+        delta = self.delta(start, end)
+        top = delta.loc[delta["delta"].abs().sort_values(ascending=False).head(n).index]
+        return top[["incident_type", "domain", *delta.columns[3:]]]
+
+
+def current_share(wide: pd.DataFrame, year: int | str) -> pd.Series:
+    """Share for one wave, or the mean over every wave when ``year`` is AVERAGE."""
+    if year == AVERAGE:
+        return wide[[f"share_{y}" for y in wave_years(wide.columns)]].mean(axis=1)
+    return wide[f"share_{year}"]
+
+
+def build_long(frames: dict[str, pd.DataFrame]) -> pd.DataFrame:
+    """Unpivot each parsed extract and stack them into a single long table.
+
+    Rows are stably grouped by (dimension, domain) so every selection is one
+    contiguous block (see block_index).
+    """
+    long = pd.concat(
+        [to_long(df, dimension=DIMENSION_OF[key]) for key, df in frames.items()],
+        ignore_index=True,
+    )
+    for col in CATEGORICALS:
+        long[col] = long[col].astype("category")
+    return long.sort_values(["dimension", "domain"], kind="stable", ignore_index=True)
+
+
+# -----------------------------------------------------------------------------
+# Snapshot cache
+# -----------------------------------------------------------------------------
+
+def _write_snapshot(dfs: dict[str, pd.DataFrame], target: Path) -> None:
+    """Write one IPC file per frame into a temp dir, then rename it into place atomically."""
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = Path(tempfile.mkdtemp(prefix=f".{target.name}-", dir=target.parent))
+    try:
+        for key, df in dfs.items():
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            with ipc.new_file(tmp / f"{key}.arrow", table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp, target)
+    except OSError:
+        # Another replica won the race (or the directory is read-only); the
+        # parsed frames are still valid, we just don't persist them.
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def _read_snapshot(target: Path, keys: list[str]) -> dict[str, pd.DataFrame] | None:
+    """Memory-map a snapshot written by _write_snapshot, or None if incomplete."""
+    files = {key: target / f"{key}.arrow" for key in keys}
+    if not all(path.exists() for path in files.values()):
+        return None
+    dfs: dict[str, pd.DataFrame] = {}
+    for key, path in files.items():
+        with pa.memory_map(str(path), "r") as source:
+            dfs[key] = ipc.open_file(source).read_all().to_pandas()
+    return dfs
+
+
+def current_version(directory: Path | None = None) -> str:
+    """Data version of the extracts currently on disk (cheap when they are unchanged)."""
+    return data_version(source_paths(directory))
+
+
+def load_survey(directory: Path | None = None, snapshots: Path | None = None) -> Survey:
+    """Return the SCB extracts as a long-format Survey, via the snapshot cache when possible."""
+    paths = source_paths(directory)
+    version = data_version(paths)
+    target = (Path(snapshots) if snapshots is not None else snapshot_dir()) / version
+    snap = _read_snapshot(target, ["survey"])
+    if snap is None:
+        snap = {"survey": build_long({key: parse_csv(path) for key, path in paths.items()})}
+        _write_snapshot(snap, target)
+    return Survey(long=snap["survey"], version=version)
@@ -0,0 +1,303 @@
+"""Structured views of SCB's free-text domain labels.
+
+Industry domains embed their SNI 2007 coverage, e.g. "manufacturing (SNI
+10-33)" or "other service companies (SNI 69-74, 77-82, 95.1)". parse_sni turns
+that into closed intervals of 5-digit codes: a division "10" covers
+10000-10999, a group "26.1" covers 26100-26199, and so on.
+
+SniIndex cuts the code line at every interval edge into elementary segments
+and records which domains cover each segment. A code then resolves with one
+binary search, however much the domains overlap (the national total, the
+cross-cutting ICT sector, labels revised between waves).
+"""
+import re
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+SNI_DIGITS = 5
+_SNI_LIST = re.compile(r"\(SNI ([^)]*)\)")
+
+
+def sni_bounds(code: str) -> tuple[int, int]:
+    """Closed 5-digit range of an SNI code at any level ("10", "26.1", "47.111")."""
+    digits = code.strip().replace(".", "")
+    if not digits.isdigit() or not 2 <= len(digits) <= SNI_DIGITS:
+        raise ValueError(f"not an SNI code: {code!r}")
+    return int(digits.ljust(SNI_DIGITS, "0")), int(digits.ljust(SNI_DIGITS, "9"))
+
+
+def parse_sni(label: str) -> list[tuple[int, int]]:
+    """The 5-digit intervals listed in a label's "(SNI ...)" part; [] if it has none.
+
+    Parts that are not codes or code ranges are skipped rather than failing the load.
+    """
+    match = _SNI_LIST.search(label)
+    if not match:
+        return []
+    intervals = []
+    for part in match.group(1).split(","):
+        first, _, last = part.strip().partition("-")
+        try:
+            intervals.append((sni_bounds(first)[0], sni_bounds(last or first)[1]))
+        except ValueError:
+            continue
+    return intervals
+
+
+def normalize_sni(codes: pd.Series) -> np.ndarray:
+    """5-digit integer SNI codes; -1 where a value is not a code.
+
+    Strings may be dotted ("62.010") or shortened to a class ("10.11" is read
+    as its first detailed code, 10110). Numeric values are taken as full
+    5-digit codes whose leading zero was lost (1110 -> 01110).
+    """
+    if pd.api.types.is_numeric_dtype(codes):
+        values = pd.to_numeric(codes, errors="coerce")
+        ok = values.notna() & (values >= 0) & (values < 10**SNI_DIGITS) & (values % 1 == 0)
+        return np.where(ok, values.fillna(-1), -1).astype(np.int64)
+    digits = codes.astype("string").str.replace(r"[\s.]", "", regex=True)
+    ok = digits.str.fullmatch(r"\d{2,5}").fillna(False)
+    padded = digits.where(ok, "").str.pad(SNI_DIGITS, side="right", fillchar="0")
+    return np.where(ok, pd.to_numeric(padded.where(ok), errors="coerce").fillna(-1), -1).astype(np.int64)
+
+
+@dataclass(frozen=True)
+class SniIndex:
+    domains: list[str]
+    width: np.ndarray  # (n_domains,) number of 5-digit codes each domain covers
+    breaks: np.ndarray  # (n_segments + 1,) segment j is [breaks[j], breaks[j + 1])
+    indptr: np.ndarray  # CSR row pointers: segment j is covered by members[indptr[j]:indptr[j + 1]]
+    members: np.ndarray  # domain positions
+
+    def locate(self, codes: np.ndarray) -> np.ndarray:
+        """Segment of each 5-digit code, -1 outside every domain."""
+        codes = np.asarray(codes, dtype=np.int64)
+        seg = np.searchsorted(self.breaks, codes, side="right") - 1
+        seg[(seg < 0) | (seg >= len(self.breaks) - 1)] = -1
+        covered = np.diff(self.indptr)
+        return np.where((seg >= 0) & (covered[np.maximum(seg, 0)] > 0), seg, -1)
+
+    def resolve(self, code: int) -> list[str]:
+        """Every domain covering one 5-digit code, narrowest first."""
+        seg = int(self.locate(np.array([code]))[0])
+        if seg < 0:
+            return []
+        found = self.members[self.indptr[seg]:self.indptr[seg + 1]]
+        return [self.domains[i] for i in found[np.argsort(self.width[found], kind="stable")]]
+
+    def segment_domain(self, allowed: np.ndarray | None = None) -> np.ndarray:
+        """Narrowest covering domain per segment among ``allowed`` (bool per domain); -1 if none."""
+        allowed = np.ones(len(self.domains), bool) if allowed is None else np.asarray(allowed, bool)
+        n_segments = len(self.breaks) - 1
+        out = np.full(n_segments, -1, dtype=np.intp)
+        if not len(self.members):
+            return out
+        width = np.where(allowed[self.members], self.width[self.members], np.iinfo(np.int64).max)
+        seg = np.repeat(np.arange(n_segments), np.diff(self.indptr))
+        # sort each segment's members by width; the first allowed one wins
+        order = np.lexsort((width, seg))
+        first = np.r_[True, seg[order][1:] != seg[order][:-1]]
+        best = order[first]
+        ok = allowed[self.members[best]]
+        out[seg[best][ok]] = self.members[best][ok]
+        return out
+
+    def domain_of(self, codes: np.ndarray, allowed: np.ndarray | None = None) -> np.ndarray:
+        """Narrowest allowed domain per 5-digit code, -1 where none covers it."""
+        seg = self.locate(codes)
+        table = self.segment_domain(allowed)
+        return np.where(seg >= 0, table[np.maximum(seg, 0)], -1)
+
+    def parents(self) -> np.ndarray:
+        """Narrowest other domain covering every code of each domain, -1 if none.
+
+        A container must cover a domain's first segment and more codes than the
+        domain, so only that segment's wider members are candidates; each is
+        kept if it also holds every other segment of the domain.
+        """
+        n = len(self.domains)
+        parent = np.full(n, -1, dtype=np.intp)
+        if not len(self.members):
+            return parent
+        seg = np.repeat(np.arange(len(self.breaks) - 1), np.diff(self.indptr))
+        covered = np.bincount(self.members, weights=np.diff(self.breaks)[seg], minlength=n).astype(np.int64)
+        # each domain's segments in order (seg is sorted, so a stable sort keeps it)
+        order = np.argsort(self.members, kind="stable")
+        own = np.bincount(self.members, minlength=n)
+        start = np.cumsum(own) - own
+        inner = np.flatnonzero(own)
+        first = seg[order][start[inner]]
+        # members of each segment by coverage: the wider ones follow a searchsorted
+        span = covered.max() + 1
+        ranked = seg * span + covered[self.members]
+        by_width = np.argsort(ranked, kind="stable")
+        lo = np.searchsorted(ranked[by_width], first * span + covered[inner], side="right")
+        counts = self.indptr[first + 1] - lo
+        step = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        outer = self.members[by_width[np.repeat(lo, counts) + step]]
+        inner = np.repeat(inner, counts)
+        # a candidate fails if any segment of the domain lacks it
+        checks = own[inner]
+        pair = np.repeat(np.arange(len(inner)), checks)
+        step = np.arange(checks.sum()) - np.repeat(np.cumsum(checks) - checks, checks)
+        wanted = seg[order][np.repeat(start[inner], checks) + step] * n + outer[pair]
+        keys = seg * n + self.members
+        found = keys[np.minimum(np.searchsorted(keys, wanted), len(keys) - 1)] == wanted
+        contains = np.bincount(pair[~found], minlength=len(inner)) == 0
+        inner, outer = inner[contains], outer[contains]
+        if not len(inner):
+            return parent  # no domain contains another
+        order = np.lexsort((covered[outer], inner))
+        first = np.r_[True, inner[order][1:] != inner[order][:-1]]
+        parent[inner[order][first]] = outer[order][first]
+        return parent
+
+
+def build_sni_index(labels: list[str]) -> SniIndex:
+    """Index the SNI coverage of ``labels``; labels without an SNI part cover nothing."""
+    intervals = [(lo, hi, i) for i, label in enumerate(labels) for lo, hi in parse_sni(label)]
+    width = np.zeros(len(labels), dtype=np.int64)
+    for lo, hi, i in intervals:
+        width[i] += hi - lo + 1
+    if not intervals:
+        return SniIndex(list(labels), width, np.zeros(1, np.int64), np.zeros(1, np.intp), np.zeros(0, np.intp))
+
+    los = np.array([lo for lo, _, _ in intervals], dtype=np.int64)
+    his = np.array([hi for _, hi, _ in intervals], dtype=np.int64) + 1
+    owner = np.array([i for _, _, i in intervals], dtype=np.intp)
+    breaks = np.unique(np.r_[los, his])
+    n_segments = len(breaks) - 1
+    # expand each interval into the (segment, domain) pairs it covers
+    first = np.searchsorted(breaks, los)
+    lengths = np.searchsorted(breaks, his) - first
+    step = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    pairs = np.unique((np.repeat(first, lengths) + step) * len(labels) + np.repeat(owner, lengths))
+    seg, members = np.divmod(pairs, len(labels))
+    indptr = np.r_[0, np.cumsum(np.bincount(seg, minlength=n_segments))].astype(np.intp)
+    return SniIndex(list(labels), width, breaks, indptr, members.astype(np.intp))
+
+
+# -----------------------------------------------------------------------------
+# Size classes
+# -----------------------------------------------------------------------------
+
+_SIZE = re.compile(r"^\s*(\d+)(?:\s*-\s*(\d+)|\s+or more)?\s+employees")
+
+
+def parse_size(label: str) -> tuple[float, float] | None:
+    """Closed head-count range of a size label ("0 employees", "10-49 employees",
+    "250 or more employees", "10 or more employees in total"); None if not a size."""
+    match = _SIZE.match(label)
+    if not match:
+        return None
+    low = float(match.group(1))
+    if match.group(2):
+        return low, float(match.group(2))
+    return (low, np.inf) if "or more" in label else (low, low)
+
+
+@dataclass(frozen=True)
+class SizeBands:
+    labels: list[str]  # hierarchy order: every band directly before its sub-bands
+    low: np.ndarray
+    high: np.ndarray
+    parent: np.ndarray  # position of the narrowest band strictly containing each band, -1 for roots
+    depth: np.ndarray
+    leaves: np.ndarray  # positions of the finest bands, by head count
+    first: np.ndarray  # each band covers leaves[first[i]:stop[i]] (pre-computed roll-ups)
+    stop: np.ndarray
+
+    def children(self, band: int) -> np.ndarray:
+        return np.flatnonzero(self.parent == band)
+
+    def ancestors(self, band: int) -> list[int]:
+        """The band's parent, grandparent, ... up to its root."""
+        out = []
+        while (band := int(self.parent[band])) >= 0:
+            out.append(band)
+        return out
+
+    def finest(self, employees: np.ndarray) -> np.ndarray:
+        """Finest band per head count, -1 where none (negative, NaN, or in a gap)."""
+        n = np.asarray(employees, dtype=np.float64)
+        if not len(self.leaves):
+            return np.full(n.shape, -1, dtype=np.intp)
+        low, high = self.low[self.leaves], self.high[self.leaves]
+        at = np.clip(np.searchsorted(low, n, side="right") - 1, 0, None)
+        return np.where((n >= low[at]) & (n <= high[at]), self.leaves[at], -1)
+
+    def rollup(self, leaf_values: np.ndarray, weights: np.ndarray | None = None) -> np.ndarray:
+        """Aggregate (..., n_leaves) values to every band: weighted mean over its leaves."""
+        w = np.ones(len(self.leaves)) if weights is None else np.asarray(weights, np.float64)
+        total = np.concatenate([np.zeros(leaf_values.shape[:-1] + (1,)), np.cumsum(leaf_values * w, axis=-1)], axis=-1)
+        mass = np.r_[0.0, np.cumsum(w)]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return (total[..., self.stop] - total[..., self.first]) / (mass[self.stop] - mass[self.first])
+
+
+def _narrowest_containers(low: np.ndarray, high: np.ndarray) -> np.ndarray:
+    """Parent of each interval: the narrowest other interval containing it, -1 if none.
+
+    ``low``/``high`` must be sorted by (low, -high). Sweeping in that order,
+    every container of an interval has already been seen, so a Fenwick tree
+    of (width, position) keyed by descending ``high`` answers "narrowest seen
+    interval reaching at least this high" in O(log n).
+    """
+    n = len(low)
+    width = np.minimum(high, np.finfo(np.float64).max / 4) - low
+    highs = np.unique(high)[::-1]
+    key = len(highs) - np.searchsorted(highs[::-1], high, side="right")  # 0 = highest
+    tree: list[tuple[float, int]] = [(np.inf, -1)] * (len(highs) + 1)
+    parent = np.full(n, -1, dtype=np.intp)
+    for j in range(n):
+        p, best = int(key[j]) + 1, (np.inf, -1)
+        while p > 0:
+            best = min(best, tree[p])
+            p -= p & -p
+        parent[j] = best[1]
+        p, item = int(key[j]) + 1, (float(width[j]), j)
+        while p <= len(highs):
+            tree[p] = min(tree[p], item)
+            p += p & -p
+    return parent
+
+
+def build_size_bands(labels: list[str]) -> SizeBands:
+    """Parse size labels into a containment tree; unparsable labels are dropped.
+
+    The finest bands are assumed not to overlap, as SCB's size classes don't.
+    """
+    parsed = [(label, bounds) for label in labels if (bounds := parse_size(label)) is not None]
+    # wider bands first at the same lower bound, so containers precede what they contain
+    parsed.sort(key=lambda item: (item[1][0], -item[1][1]))
+    low = np.array([b[0] for _, b in parsed], dtype=np.float64)
+    high = np.array([b[1] for _, b in parsed], dtype=np.float64)
+    n = len(parsed)
+    parent = _narrowest_containers(low, high)
+
+    # pre-order walk, children in sorted order
+    by_parent = np.argsort(parent, kind="stable")
+    counts = np.bincount(parent + 1, minlength=n + 1)
+    offsets = np.r_[0, np.cumsum(counts)]
+    order: list[int] = []
+    stack = list(by_parent[offsets[0]:offsets[1]][::-1])
+    while stack:
+        band = int(stack.pop())
+        order.append(band)
+        stack.extend(by_parent[offsets[band + 1]:offsets[band + 2]][::-1])
+
+    rank = np.empty(n, dtype=np.intp)
+    rank[order] = np.arange(n)
+    low, high = low[order], high[order]
+    parent = np.where(parent[order] >= 0, rank[np.maximum(parent[order], 0)], -1)
+    depth = np.zeros(n, dtype=np.intp)
+    for i in range(n):
+        depth[i] = depth[parent[i]] + 1 if parent[i] >= 0 else 0
+
+    leaves = np.setdiff1d(np.arange(n), parent)
+    leaves = leaves[np.argsort(low[leaves], kind="stable")]
+    first = np.searchsorted(low[leaves], low, side="left")
+    stop = np.searchsorted(high[leaves], high, side="right")
+    return SizeBands([parsed[i][0] for i in order], low, high, parent, depth, leaves, first, np.maximum(stop, first))
@@ -0,0 +1,210 @@
+"""Bulk export of many views at once: a ZIP of CSVs or a partitioned Parquet dataset.
+
+    python export.py views.zip --dimension region --year 2023 --year 2025
+    python export.py views/ --dimension industry          # Parquet, partitioned by dimension/period
+
+A view is one (dimension, domain) selection at one period; its rows are the
+ones the dashboard shows (queries.view_rows). The ZIP holds one CSV per view
+in the "Download CSV" format (";"-separated, cp1252). The Parquet dataset
+holds every selected view in one table, partitioned as
+``dimension=<d>/period=<p>/``.
+
+Both writers stream: views are written as they are produced, Parquet in
+row groups of about CHUNK_ROWS, so memory does not depend on the size of the
+selection. ExportJob runs an export on a background thread and exposes its
+progress, which the dashboard polls.
+"""
+import argparse
+import io
+import shutil
+import sys
+import tempfile
+import threading
+import weakref
+import zipfile
+from pathlib import Path
+from typing import Callable, Iterable, Iterator
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import dataset
+import queries
+from build import slug
+
+CHUNK_ROWS = 50_000
+ZIP = "zip"
+PARQUET = "parquet"
+
+
+def selection(
+    survey: dataset.Survey,
+    dimensions: Iterable[str] | None = None,
+    domains: Iterable[str] | None = None,
+    periods: Iterable[int | str] | None = None,
+) -> list[tuple[str, str, int | str]]:
+    """Every (dimension, domain, period) matching the filters; None keeps everything."""
+    cube = queries.load_cube(survey)
+    dims = None if dimensions is None else set(dimensions)
+    doms = None if domains is None else set(domains)
+    wanted = cube.periods if periods is None else [p for p in cube.periods if p in set(periods)]
+    return [
+        (dimension, domain, period)
+        for dimension, domain in cube.slices
+        if (dims is None or dimension in dims) and (doms is None or domain in doms)
+        for period in wanted
+    ]
+
+
+def _frames(survey: dataset.Survey, views: list[tuple[str, str, int | str]]) -> Iterator[pd.DataFrame]:
+    for dimension, domain, period in views:
+        yield queries.view_rows(survey, dimension, domain, period).assign(period=str(period))
+
+
+def write_zip(
+    survey: dataset.Survey,
+    views: list[tuple[str, str, int | str]],
+    target: Path | io.IOBase,
+    progress: Callable[[int], None] | None = None,
+) -> None:
+    """One CSV per view, streamed into a ZIP archive."""
+    with zipfile.ZipFile(target, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for (dimension, domain, period), frame in zip(views, _frames(survey, views)):
+            with archive.open(f"{dimension}/{slug(domain)}/{period}.csv", "w") as fh:
+                fh.write(frame.drop(columns="period").to_csv(index=False, sep=";").encode("cp1252", errors="replace"))
+            if progress is not None:
+                progress(1)
+
+
+def write_parquet(
+    survey: dataset.Survey,
+    views: list[tuple[str, str, int | str]],
+    target: Path,
+    progress: Callable[[int], None] | None = None,
+) -> None:
+    """Every view in one Parquet dataset under ``target``, partitioned by dimension and period."""
+    target.mkdir(parents=True, exist_ok=True)
+    writers: dict[tuple[str, str], pq.ParquetWriter] = {}
+    pending: dict[tuple[str, str], list[pd.DataFrame]] = {}
+    sizes: dict[tuple[str, str], int] = {}
+
+    def flush(key: tuple[str, str]) -> None:
+        frames = pending.pop(key, [])
+        sizes.pop(key, None)
+        if not frames:
+            return
+        table = pa.Table.from_pandas(pd.concat(frames, ignore_index=True).drop(columns=["dimension", "period"]), preserve_index=False)
+        if key not in writers:
+            folder = target / f"dimension={key[0]}" / f"period={key[1]}"
+            folder.mkdir(parents=True, exist_ok=True)
+            writers[key] = pq.ParquetWriter(folder / "part-0.parquet", table.schema)
+        writers[key].write_table(table)
+
+    try:
+        for frame in _frames(survey, views):
+            # categories differ per view; plain strings keep one schema per partition
+            frame = frame.astype({column: "string" for column in dataset.CATEGORICALS})
+            key = (str(frame["dimension"].iat[0]), str(frame["period"].iat[0])) if len(frame) else None
+            if key is not None:
+                pending.setdefault(key, []).append(frame)
+                sizes[key] = sizes.get(key, 0) + len(frame)
+                if sizes[key] >= CHUNK_ROWS:
+                    flush(key)
+            if progress is not None:
+                progress(1)
+        for key in list(pending):
+            flush(key)
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+
+class ExportJob:
+    """An export running on a background thread; poll ``done`` / ``total`` / ``finished``.
+
+    The result is a single file at ``path`` (Parquet datasets are zipped,
+    uncompressed, for download); ``error`` holds the message if it failed.
+    The working directory goes with the job: on cleanup(), when the job is
+    garbage collected (e.g. with its dashboard session) or at exit.
+    """
+
+    def __init__(self, survey: dataset.Survey, views: list[tuple[str, str, int | str]], fmt: str = ZIP):
+        self.total = len(views)
+        self.done = 0
+        self.format = fmt
+        self.error: str | None = None
+        self.path: Path | None = None
+        self._lock = threading.Lock()
+        self._finished = threading.Event()
+        self._workdir = Path(tempfile.mkdtemp(prefix="scb-export-"))
+        self._remove = weakref.finalize(self, shutil.rmtree, self._workdir, ignore_errors=True)
+        self._thread = threading.Thread(target=self._run, args=(survey, views), daemon=True)
+        self._thread.start()
+
+    @property
+    def finished(self) -> bool:
+        return self._finished.is_set()
+
+    @property
+    def fraction(self) -> float:
+        return self.done / self.total if self.total else 1.0
+
+    def wait(self, timeout: float | None = None) -> bool:
+        return self._finished.wait(timeout)
+
+    def _advance(self, n: int) -> None:
+        with self._lock:
+            self.done += n
+
+    def _run(self, survey: dataset.Survey, views: list[tuple[str, str, int | str]]) -> None:
+        try:
+            if self.format == ZIP:
+                path = self._workdir / "views.zip"
+                write_zip(survey, views, path, self._advance)
+            else:
+                folder = self._workdir / "views"
+                write_parquet(survey, views, folder, self._advance)
+                path = self._workdir / "views-parquet.zip"
+                with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_STORED) as archive:
+                    for file in sorted(folder.rglob("*.parquet")):
+                        archive.write(file, file.relative_to(folder))
+                shutil.rmtree(folder, ignore_errors=True)
+            self.path = path
+        except Exception as exc:  # surfaced to the caller through ``error``
+            self.error = f"{type(exc).__name__}: {exc}"
+        finally:
+            self._finished.set()
+
+    def cleanup(self) -> None:
+        self._remove()
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("target", type=Path, help="a .zip file (CSV per view) or a directory (Parquet dataset)")
+    parser.add_argument("--dimension", action="append", help="repeatable; default: all")
+    parser.add_argument("--domain", action="append", help="repeatable; default: all")
+    parser.add_argument("--year", action="append", help="repeatable wave, 'Average' or projected wave; default: all")
+    args = parser.parse_args(argv)
+
+    survey = queries.current_survey()
+    known = queries.load_cube(survey).periods
+    periods = None
+    if args.year is not None:
+        periods = [int(y) if y.isdigit() else y for y in args.year]
+        unknown = [y for y, p in zip(args.year, periods) if p not in known]
+        if unknown:
+            parser.error(f"unknown --year {', '.join(unknown)}; one of {', '.join(map(str, known))}")
+    views = selection(survey, args.dimension, args.domain, periods)
+    if not views:
+        parser.exit(1, "export.py: nothing to export: no view matches the filters\n")
+    if args.target.suffix.lower() == ".zip":
+        write_zip(survey, views, args.target)
+    else:
+        write_parquet(survey, views, args.target)
+    print(f"exported {len(views)} views -> {args.target}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
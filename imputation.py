@@ -0,0 +1,157 @@
+"""Estimates for the shares SCB suppresses ("..") or does not publish.
+
+Every domain hangs off a parent that covers it: regions off "Sweden",
+industries off the narrowest SNI domain containing them (ultimately the
+total), size classes off their head-count band ("1-9 employees in total" ->
+"1-4 employees", ...). On the logit scale a series sits at a fixed offset
+from its parent series (same incident type),
+
+    logit p[child, t] = logit p[parent, t] + delta[child],
+
+and delta is estimated from the waves in which both are known. Offsets rest
+on one or two noisy waves, so they are shrunk towards zero (the parent's
+value) with weight tau² / (tau² + var), where var is the offset's sampling
+variance (from the margins of error, delta method) and tau² the spread of
+the offsets of the same dimension and level, estimated by the method of
+moments. A suppressed cell is then parent + shrunk offset, with variance
+var(parent) + posterior var(offset).
+
+Roots, and children whose parent is missing in that wave too, fall back on
+their own other waves plus the wave-to-wave variance of all series. The
+whole table is processed level by level, top-down, one array pass per level,
+so estimated parents can serve their children. Cells with nothing to go on
+stay NaN.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+import dataset
+from significance import MOE_FLOOR, Z95
+
+# Shares are published in whole percents: a 0 means "below 0.5".
+EDGE = 0.005
+REGION_TOTAL = "Sweden"
+_TAU2_FLOOR = 1e-6
+
+
+@dataclass(frozen=True)
+class Imputation:
+    years: list[int]
+    share: np.ndarray  # (n_series, n_years) in %, reported or estimated; NaN where neither is possible
+    moe: np.ndarray  # (n_series, n_years) 95 % margin of ``share``, in percentage points
+    estimated: np.ndarray  # (n_series, n_years) True where ``share`` is an estimate
+    parent: np.ndarray  # (n_series,) row of the parent series in Survey.table, -1 for roots
+
+
+def domain_parents(survey: dataset.Survey) -> dict[tuple[str, str], str]:
+    """(dimension, domain) -> parent domain, for every domain that has one."""
+    parents: dict[tuple[str, str], str] = {}
+    for domain in survey.domains("region"):
+        if domain != REGION_TOTAL and REGION_TOTAL in survey.domains("region"):
+            parents[("region", domain)] = REGION_TOTAL
+    sni = survey.sni
+    for i, up in enumerate(sni.parents()):
+        if up >= 0:
+            parents[("industry", sni.domains[i])] = sni.domains[up]
+    sizes = survey.sizes
+    for i, up in enumerate(sizes.parent):
+        if up >= 0:
+            parents[("size", sizes.labels[i])] = sizes.labels[up]
+    return parents
+
+
+def _logit(p: np.ndarray) -> np.ndarray:
+    return np.log(p) - np.log1p(-p)
+
+
+def _expit(x: np.ndarray) -> np.ndarray:
+    return 0.5 * (1.0 + np.tanh(0.5 * x))
+
+
+def _pooled_mean(y: np.ndarray, var: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Precision-weighted mean over the last axis, skipping NaN; NaN / inf variance if none."""
+    ok = ~np.isnan(y)
+    precision = np.where(ok, 1.0 / np.where(ok, var, 1.0), 0.0).sum(axis=-1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(ok, y / np.where(ok, var, 1.0), 0.0).sum(axis=-1) / precision
+        return mean, 1.0 / precision
+
+
+def _wave_variance(y: np.ndarray, var: np.ndarray) -> float:
+    """Method-of-moments between-wave variance of the logits, over series known in every wave."""
+    full = ~np.isnan(y).any(axis=1)
+    if full.sum() < 2 or y.shape[1] < 2:
+        return 0.0
+    spread = y[full].var(axis=1, ddof=1) - var[full].mean(axis=1)
+    return float(max(spread.mean(), 0.0))
+
+
+def impute(survey: dataset.Survey) -> Imputation:
+    """Fill every suppressed cell of Survey.table that a parent or another wave can reach."""
+    table = survey.table
+    years = survey.years
+    share = table[[f"share_{y}" for y in years]].to_numpy(np.float64) / 100.0
+    moe = np.maximum(table[[f"moe_{y}" for y in years]].to_numpy(np.float64), MOE_FLOOR) / 100.0
+    reported = ~np.isnan(share)
+    p = np.clip(share, EDGE, 1.0 - EDGE)
+    y = _logit(p)
+    var = np.square(moe / Z95 / (p * (1.0 - p)))  # delta method
+    var[~reported] = np.nan
+
+    # parent row and depth of every series
+    parents = domain_parents(survey)
+    keys = pd.MultiIndex.from_arrays([table["dimension"].astype(str), table["domain"].astype(str), table["incident_type"].astype(str)])
+    up_keys = pd.MultiIndex.from_arrays([
+        table["dimension"].astype(str),
+        [parents.get(key, "") for key in zip(table["dimension"].astype(str), table["domain"].astype(str))],
+        table["incident_type"].astype(str),
+    ])
+    parent = keys.get_indexer(up_keys).astype(np.intp)
+    depth = np.zeros(len(table), dtype=np.intp)
+    for row in range(len(table)):
+        at = parent[row]
+        while at >= 0:
+            depth[row] += 1
+            at = parent[at]
+    dims = pd.factorize(table["dimension"])[0]
+
+    fill, fill_var = y.copy(), var.copy()
+    wave_var = _wave_variance(y, var)
+    own, own_var = _pooled_mean(y, var)
+
+    for level in range(int(depth.max(initial=-1)) + 1):
+        rows = np.flatnonzero(depth == level)
+        kids = rows[parent[rows] >= 0]
+        if len(kids):
+            up = parent[kids]
+            offset = y[kids] - fill[up]
+            mean, mean_var = _pooled_mean(offset, var[kids] + fill_var[up])
+            known = ~np.isnan(mean)
+            # tau² per dimension: spread of the offsets beyond their noise
+            group = dims[kids]
+            n = np.bincount(group[known], minlength=group.max() + 1)
+            excess = np.bincount(group[known], weights=np.square(mean[known]) - mean_var[known], minlength=len(n))
+            tau2 = np.maximum(np.divide(excess, n, out=np.zeros(len(n)), where=n > 0), _TAU2_FLOOR)[group]
+            weight = np.where(known, tau2 / (tau2 + np.where(known, mean_var, 0.0)), 0.0)
+            shrunk = weight * np.nan_to_num(mean)
+            shrunk_var = np.where(known, weight * np.where(known, mean_var, 0.0), tau2)
+            gap = np.isnan(fill[kids])
+            fill[kids] = np.where(gap, fill[up] + shrunk[:, None], fill[kids])
+            fill_var[kids] = np.where(gap, fill_var[up] + shrunk_var[:, None], fill_var[kids])
+        # whatever is still missing at this level: the series' own other waves
+        gap = np.isnan(fill[rows])
+        fill[rows] = np.where(gap, own[rows, None], fill[rows])
+        fill_var[rows] = np.where(gap, own_var[rows, None] + wave_var, fill_var[rows])
+
+    estimate = _expit(fill)
+    half_width = Z95 * np.sqrt(fill_var) * estimate * (1.0 - estimate)
+    estimated = ~reported & ~np.isnan(fill)
+    return Imputation(
+        years=years,
+        share=np.where(reported, share, estimate) * 100.0,
+        moe=np.where(reported, table[[f"moe_{y}" for y in years]].to_numpy(np.float64) / 100.0, half_width) * 100.0,
+        estimated=estimated,
+        parent=parent,
+    )
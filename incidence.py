@@ -0,0 +1,125 @@
+"""Estimate the share of enterprises with *any* incident from per-type shares.
+
+SCB reports one share per incident type. The types overlap (an enterprise can
+suffer several), so their sum overstates the share affected by at least one.
+For per-type probabilities p_1..p_k of one view:
+
+* Fréchet bounds hold with no assumption at all:
+  max(p_i) <= P(any) <= min(1, sum(p_i)).
+* Independence gives 1 - prod(1 - p_i).
+* Given pairwise correlations rho_ij of the incident indicators (co-occurrence
+  data), the pairwise joints p_ij = p_i p_j + rho_ij sqrt(p_i q_i p_j q_j)
+  tighten the bounds to Dawson-Sankoff (lower) and Hunter (upper), and the
+  second-order Bahadur expansion
+      P(none) = prod(q_i) * (1 + sum_{i<j} rho_ij sqrt(p_i p_j / (q_i q_j)))
+  gives a correlation-adjusted point estimate, clipped into those bounds.
+
+Every function works on dense (..., k) arrays, so all views and periods are
+estimated in one pass. Missing types (NaN) are left out of the union.
+"""
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+_EPS = 1e-12
+
+
+def frechet_bounds(p: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Assumption-free (lower, upper) bounds on P(any) over the last axis."""
+    p = np.nan_to_num(p, nan=0.0)
+    return p.max(axis=-1), np.minimum(p.sum(axis=-1), 1.0)
+
+
+def independent(p: np.ndarray) -> np.ndarray:
+    """P(any) if the incident types occur independently."""
+    p = np.clip(np.nan_to_num(p, nan=0.0), 0.0, 1.0)
+    return -np.expm1(np.log1p(-p).sum(axis=-1))
+
+
+def pairwise_joint(p: np.ndarray, rho: np.ndarray) -> np.ndarray:
+    """P(i and j) from marginals (..., k) and correlations (k, k) or (..., k, k).
+
+    Clipped to the pairwise Fréchet range so inconsistent inputs stay valid.
+    """
+    p = np.clip(np.nan_to_num(p, nan=0.0), 0.0, 1.0)
+    sd = np.sqrt(p * (1.0 - p))
+    pi, pj = p[..., :, None], p[..., None, :]
+    joint = pi * pj + rho * sd[..., :, None] * sd[..., None, :]
+    return np.clip(joint, np.maximum(pi + pj - 1.0, 0.0), np.minimum(pi, pj))
+
+
+def dawson_sankoff(p: np.ndarray, joint: np.ndarray) -> np.ndarray:
+    """Second-order lower bound on P(any) from S1 = sum p_i and S2 = sum_{i<j} p_ij."""
+    s1 = np.nan_to_num(p, nan=0.0).sum(axis=-1)
+    k = joint.shape[-1]
+    s2 = (joint.sum(axis=(-2, -1)) - np.trace(joint, axis1=-2, axis2=-1)) / 2.0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        m = 1.0 + np.floor(2.0 * s2 / np.maximum(s1, _EPS))
+        m = np.clip(m, 1.0, max(k - 1, 1))
+        bound = 2.0 * s1 / (m + 1.0) - 2.0 * s2 / (m * (m + 1.0))
+    return np.where(s1 > 0, np.clip(bound, 0.0, 1.0), 0.0)
+
+
+def hunter(p: np.ndarray, joint: np.ndarray) -> np.ndarray:
+    """Hunter's upper bound: S1 minus the maximum spanning tree of the p_ij graph.
+
+    The spanning tree is found with Prim's algorithm, vectorized over the
+    leading axes (k - 1 steps of k-wide array operations).
+    """
+    s1 = np.nan_to_num(p, nan=0.0).sum(axis=-1)
+    k = joint.shape[-1]
+    lead = joint.shape[:-2]
+    in_tree = np.zeros(lead + (k,), dtype=bool)
+    in_tree[..., 0] = True
+    best = joint[..., 0, :].copy()
+    tree = np.zeros(lead)
+    for _ in range(k - 1):
+        cand = np.where(in_tree, -np.inf, best)
+        j = cand.argmax(axis=-1)[..., None]
+        tree += np.take_along_axis(cand, j, axis=-1)[..., 0]
+        np.put_along_axis(in_tree, j, True, axis=-1)
+        row = np.take_along_axis(joint, j[..., None], axis=-2)[..., 0, :]
+        best = np.maximum(best, row)
+    return np.clip(s1 - tree, 0.0, 1.0)
+
+
+def bahadur(p: np.ndarray, rho: np.ndarray) -> np.ndarray:
+    """Second-order Bahadur estimate of P(any) given pairwise correlations."""
+    p = np.clip(np.nan_to_num(p, nan=0.0), 0.0, 1.0 - 1e-9)
+    q = 1.0 - p
+    s = np.sqrt(p / q)
+    off = np.array(rho, dtype=np.float64, copy=True)
+    off[..., np.arange(off.shape[-1]), np.arange(off.shape[-1])] = 0.0
+    pairs = np.einsum("...i,...ij,...j->...", s, np.broadcast_to(off, s.shape[:-1] + off.shape[-2:]), s) / 2.0
+    none = np.exp(np.log(q).sum(axis=-1)) * (1.0 + pairs)
+    return 1.0 - np.clip(none, 0.0, 1.0)
+
+
+def any_incident(p: np.ndarray, rho: np.ndarray | None = None) -> dict[str, np.ndarray]:
+    """lower / upper bounds and the point estimate of P(any) over the last axis.
+
+    ``estimate`` is the independence value, or the correlation-adjusted one
+    when ``rho`` is supplied; it always lies within [lower, upper].
+    """
+    lower, upper = frechet_bounds(p)
+    indep = independent(p)
+    if rho is None:
+        return {"lower": lower, "upper": upper, "independent": indep, "estimate": indep}
+    joint = pairwise_joint(p, rho)
+    lower = np.maximum(lower, dawson_sankoff(p, joint))
+    upper = np.minimum(upper, hunter(p, joint))
+    estimate = np.clip(bahadur(p, rho), lower, upper)
+    return {"lower": lower, "upper": upper, "independent": indep, "estimate": estimate}
+
+
+def load_correlation(path: Path, incident_types: list[str]) -> np.ndarray:
+    """Read a square incident-type correlation matrix (CSV, labelled rows and columns).
+
+    Types missing from the file are treated as uncorrelated with the others.
+    """
+    frame = pd.read_csv(path, index_col=0)
+    rho = frame.reindex(index=incident_types, columns=incident_types).to_numpy(dtype=np.float64)
+    rho = np.nan_to_num((rho + rho.T) / 2.0, nan=0.0)
+    np.fill_diagonal(rho, 1.0)
+    return rho
@@ -0,0 +1,277 @@
+"""Score a portfolio file of enterprises against the SCB profile risk model.
+
+Each input row carries an SNI code, a region name and an employee count.
+Rows are mapped onto the model's industry, region and size bands and get one
+risk column per incident type plus ``any_incident`` (all in %). A value that
+matches no band is scored against that dimension's average instead.
+Enterprises under 10 employees fall outside the industry and region
+extracts; their scores are the model's size offsets (see scoring.py).
+
+The input (CSV or Parquet) is read in chunks of ``chunk_rows``; chunks are
+scored in a process pool with at most two chunks per worker in flight and
+written in input order, so memory stays flat however long the file is.
+
+    python portfolio.py enterprises.parquet scores.parquet --year 2023
+"""
+import argparse
+import os
+import sys
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import dataset
+import incidence
+from cube import build_cube
+from domains import SizeBands, SniIndex, normalize_sni
+from queries import incident_correlation
+from scoring import RiskModel, build_risk_model, profile_bands
+
+CHUNK_ROWS = 200_000
+COLUMNS = {"sni": "sni", "region": "region", "employees": "employees"}
+
+
+@dataclass(frozen=True)
+class Lookup:
+    """Everything a worker needs to score rows, small enough to ship to each process."""
+
+    incident_types: list[str]
+    bands: dict[str, list[str]]
+    sni: SniIndex  # the survey's industry domains
+    sni_band: np.ndarray  # SNI segment -> industry band, -1 if unmapped
+    region: dict[str, int]  # lower-cased region name -> region band
+    sizes: SizeBands  # the survey's size hierarchy
+    size_band: np.ndarray  # size hierarchy position -> size band, -1 if not a band
+    joint: np.ndarray  # (n_industry + 1, n_region + 1, n_size + 1, n_types); last slot = dimension average
+    any: np.ndarray  # (n_industry + 1, n_region + 1, n_size + 1)
+
+
+def _with_averages(values: np.ndarray, axes: int) -> np.ndarray:
+    """Append the (unweighted) mean over each of the first ``axes`` axes as an extra slot."""
+    for axis in range(axes):
+        values = np.concatenate([values, values.mean(axis=axis, keepdims=True)], axis=axis)
+    return values
+
+
+def build_lookup(survey: dataset.Survey, model: RiskModel, period: int | str, correlation: np.ndarray | None = None) -> Lookup:
+    """Band lookup tables plus the model's scores for one period."""
+    published = profile_bands(survey)
+    names = model.bands
+
+    # narrowest band domain per SNI segment; aggregates such as the total are skipped
+    band_of = {domain: names["industry"].index(band) for band, domains in published["industry"].items() for domain in domains}
+    allowed = np.array([domain in band_of for domain in survey.sni.domains])
+    band_at = np.array([band_of.get(domain, -1) for domain in survey.sni.domains], dtype=np.intp)
+    domain = survey.sni.segment_domain(allowed)
+    sni_band = np.where(domain >= 0, band_at[np.maximum(domain, 0)], -1)
+
+    size_band = np.array([names["size"].index(label) if label in names["size"] else -1 for label in survey.sizes.labels], dtype=np.intp)
+
+    joint = _with_averages(model.joint[model.periods.index(period)] / 100.0, 3)
+    union = incidence.any_incident(joint, correlation)
+    return Lookup(
+        incident_types=model.incident_types,
+        bands=names,
+        sni=survey.sni,
+        sni_band=sni_band,
+        region={name.lower(): i for i, name in enumerate(names["region"])},
+        sizes=survey.sizes,
+        size_band=size_band,
+        joint=joint * 100.0,
+        any=union["estimate"] * 100.0,
+    )
+
+
+def map_industry(lookup: Lookup, sni: pd.Series) -> np.ndarray:
+    """Industry band per SNI code ("62010", "62.01", 62010, ...); -1 if unmapped."""
+    seg = lookup.sni.locate(normalize_sni(sni))
+    return np.where(seg >= 0, lookup.sni_band[np.maximum(seg, 0)], -1)
+
+
+def map_region(lookup: Lookup, region: pd.Series) -> np.ndarray:
+    names = region.astype("string").str.strip().str.lower()
+    return names.map(lookup.region).fillna(-1).to_numpy(dtype=np.intp)
+
+
+def map_size(lookup: Lookup, employees: pd.Series) -> np.ndarray:
+    """Finest size band per head count; -1 if unmapped."""
+    finest = lookup.sizes.finest(pd.to_numeric(employees, errors="coerce").to_numpy(dtype=np.float64))
+    return np.where(finest >= 0, lookup.size_band[np.maximum(finest, 0)], -1)
+
+
+def score_frame(lookup: Lookup, frame: pd.DataFrame, columns: dict[str, str] = COLUMNS) -> pd.DataFrame:
+    """``frame`` plus its bands, one risk column per incident type and any_incident."""
+    codes = [
+        map_industry(lookup, frame[columns["sni"]]),
+        map_region(lookup, frame[columns["region"]]),
+        map_size(lookup, frame[columns["employees"]]),
+    ]
+    out = frame.copy()
+    for dimension, code in zip(["industry", "region", "size"], codes):
+        out[f"{dimension}_band"] = pd.Categorical.from_codes(code, categories=lookup.bands[dimension])
+    # -1 (unmapped) indexes the appended average slot
+    at = tuple(codes)
+    scores = lookup.joint[at].astype(np.float32)
+    for k, kind in enumerate(lookup.incident_types):
+        out[kind] = scores[:, k]
+    out["any_incident"] = lookup.any[at].astype(np.float32)
+    return out
+
+
+# -----------------------------------------------------------------------------
+# Streaming
+# -----------------------------------------------------------------------------
+
+_LOOKUP: Lookup | None = None
+
+
+def _init_worker(lookup: Lookup) -> None:
+    global _LOOKUP
+    _LOOKUP = lookup
+
+
+def _score_chunk(frame: pd.DataFrame, columns: dict[str, str]) -> pd.DataFrame:
+    return score_frame(_LOOKUP, frame, columns)
+
+
+def read_chunks(
+    path: Path,
+    chunk_rows: int = CHUNK_ROWS,
+    text: tuple[str, ...] = (COLUMNS["sni"],),
+    numeric: tuple[str, ...] = (COLUMNS["employees"],),
+) -> Iterator[pd.DataFrame]:
+    """Yield the file in frames of at most ``chunk_rows`` rows (CSV or Parquet).
+
+    ``text`` columns are read from CSV as strings, so SNI codes keep leading
+    zeros; ``numeric`` columns as float64, blank or non-numeric values as NaN.
+    Every CSV chunk therefore has the same dtypes, whatever its values.
+    """
+    if path.suffix.lower() in {".parquet", ".pq"}:
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+        return
+    for frame in pd.read_csv(path, chunksize=chunk_rows, dtype={name: "string" for name in (*text, *numeric)}):
+        for name in numeric:
+            if name in frame:
+                frame[name] = pd.to_numeric(frame[name], errors="coerce").astype(np.float64)
+        yield frame
+
+
+class _Writer:
+    """Appends scored frames to a CSV or Parquet file."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.parquet = path.suffix.lower() in {".parquet", ".pq"}
+        self._writer: pq.ParquetWriter | None = None
+        self._first = True
+
+    def write(self, frame: pd.DataFrame) -> None:
+        if self.parquet:
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.path, table.schema)
+            elif not table.schema.equals(self._writer.schema):
+                # pass-through columns may still infer differently per chunk
+                table = table.cast(self._writer.schema)
+            self._writer.write_table(table)
+        else:
+            frame.to_csv(self.path, mode="w" if self._first else "a", header=self._first, index=False)
+        self._first = False
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+
+
+def load_model(directory: Path | None = None) -> tuple[dataset.Survey, RiskModel, np.ndarray | None]:
+    """Survey, risk model and incident correlation, built like the dashboard's (SCB_INCIDENT_CORRELATION included)."""
+    survey = dataset.load_survey(directory)
+    correlation = incident_correlation(survey)
+    return survey, build_risk_model(survey, build_cube(survey, correlation), correlation=correlation), correlation
+
+
+def score_file(
+    source: Path,
+    target: Path,
+    period: int | str | None = None,
+    columns: dict[str, str] = COLUMNS,
+    chunk_rows: int = CHUNK_ROWS,
+    workers: int | None = None,
+    data: Path | None = None,
+    loaded: tuple[dataset.Survey, RiskModel, np.ndarray | None] | None = None,
+) -> int:
+    """Stream ``source`` through the model into ``target``; returns the number of rows scored.
+
+    ``period`` defaults to the latest wave; ``workers`` to every core (1 scores
+    in this process). ``loaded`` reuses a load_model() result.
+    """
+    survey, model, correlation = load_model(data) if loaded is None else loaded
+    lookup = build_lookup(survey, model, survey.years[-1] if period is None else period, correlation)
+    workers = workers or os.cpu_count() or 1
+    writer = _Writer(target)
+    rows = 0
+    try:
+        if workers == 1:
+            for frame in read_chunks(source, chunk_rows, (columns["sni"],), (columns["employees"],)):
+                writer.write(score_frame(lookup, frame, columns))
+                rows += len(frame)
+            return rows
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(lookup,)) as pool:
+            rows = _stream(pool, read_chunks(source, chunk_rows, (columns["sni"],), (columns["employees"],)), columns, writer, 2 * workers)
+        return rows
+    finally:
+        writer.close()
+
+
+def _stream(pool: Executor, chunks: Iterator[pd.DataFrame], columns: dict[str, str], writer: _Writer, in_flight: int) -> int:
+    """Submit chunks with a bounded queue, writing results in submission order."""
+    pending: deque[Future] = deque()
+    rows = 0
+    for frame in chunks:
+        if len(pending) >= in_flight:
+            done = pending.popleft().result()
+            writer.write(done)
+            rows += len(done)
+        pending.append(pool.submit(_score_chunk, frame, columns))
+    while pending:
+        done = pending.popleft().result()
+        writer.write(done)
+        rows += len(done)
+    return rows
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", type=Path, help="CSV or Parquet file of enterprises")
+    parser.add_argument("target", type=Path, help="output file; .parquet writes Parquet, anything else CSV")
+    parser.add_argument("--year", help="survey wave to score against (default: latest; 'Average' for the mean, or a projected wave)")
+    parser.add_argument("--sni-column", default=COLUMNS["sni"])
+    parser.add_argument("--region-column", default=COLUMNS["region"])
+    parser.add_argument("--employees-column", default=COLUMNS["employees"])
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="rows per chunk")
+    parser.add_argument("--workers", type=int, help="worker processes (default: all cores)")
+    parser.add_argument("--data", type=Path, help="directory with the SCB CSVs (default: SCB_DATA_DIR or next to this file)")
+    args = parser.parse_args(argv)
+
+    loaded = load_model(args.data)
+    periods = loaded[1].periods
+    period = None
+    if args.year is not None:
+        period = args.year if args.year == dataset.AVERAGE else int(args.year) if args.year.isdigit() else args.year
+        if period not in periods:
+            parser.error(f"unknown --year {args.year!r}; one of {', '.join(map(str, periods))}")
+    columns = {"sni": args.sni_column, "region": args.region_column, "employees": args.employees_column}
+    rows = score_file(args.source, args.target, period, columns, args.chunk_rows, args.workers, args.data, loaded)
+    print(f"scored {rows} rows -> {args.target}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Data loading and per-view queries shared by the dashboard and the HTTP API.
+
+Everything here is memoized in the process-wide RESOURCES cache per data
+version, so app.py reruns and api.py requests in one process share the same
+artefacts, and nothing here touches Streamlit.
+"""
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import dataset
+from cache import RESOURCES, memoize
+from clustering import Clusters, build_clusters
+from cube import Cube, build_cube
+from incidence import load_correlation
+from scoring import RiskModel, build_risk_model
+from significance import change_significance
+from uncertainty import Intervals, simulate
+
+
+def current_survey() -> dataset.Survey:
+    """Survey of the extracts currently on disk (raises FileNotFoundError for a missing CSV)."""
+    return RESOURCES.get_or_build("survey", dataset.current_version(), dataset.load_survey)
+
+
+# v7: derived global artefacts, shared by all sessions and keyed by data version
+@memoize("max_share")
+def max_share(survey: dataset.Survey) -> float:
+    # v19: projections may run past the largest published share
+    return max(float(survey.long["share"].max()), float(np.nanmax(load_cube(survey).filled)))
+
+
+@memoize("top_changes")
+def top_changes(survey: dataset.Survey, n: int, start: int, end: int) -> pd.DataFrame:
+    return survey.top_changes(n, start, end)
+
+
+def incident_correlation(survey: dataset.Survey) -> np.ndarray | None:
+    # v12: optional incident-type correlation matrix (co-occurrence data)
+    path = os.environ.get("SCB_INCIDENT_CORRELATION")
+    types = survey.table["incident_type"].cat.categories.tolist()
+    return load_correlation(Path(path), types) if path else None
+
+
+@memoize("cube")
+def load_cube(survey: dataset.Survey) -> Cube:
+    return build_cube(survey, incident_correlation(survey))
+
+
+@memoize("risk_model")
+def load_risk_model(survey: dataset.Survey) -> RiskModel:
+    # v14: joint industry × region × size scores, raked from the three margins
+    return build_risk_model(survey, load_cube(survey), correlation=incident_correlation(survey))
+
+
+@memoize("clusters")
+def load_clusters(survey: dataset.Survey, period: int | str) -> Clusters:
+    # v20: spherical k-means over every view's incident mix, per period
+    return build_clusters(survey, load_cube(survey), period)
+
+
+tested_changes = memoize("significance")(change_significance)
+
+
+@memoize("intervals")
+def load_intervals(survey: dataset.Survey, start: int, end: int) -> Intervals:
+    # v13: Monte Carlo over the published margins of error, once per data version
+    return simulate(survey, start=start, end=end)
+
+
+@memoize("intervals_ahead")
+def load_projected_intervals(survey: dataset.Survey) -> Intervals:
+    # v19 + v13: the projected waves are simulated separately, once one is viewed
+    return simulate(survey, top_n=0, ahead=True)
+
+
+def delta_window(survey: dataset.Survey) -> tuple[int, int]:
+    """The two latest survey waves (v5: the year-on-year change shown by default)."""
+    years = survey.years
+    return (years[-2], years[-1]) if len(years) > 1 else (years[0], years[0])
+
+
+# -----------------------------------------------------------------------------
+# Per-view queries
+# -----------------------------------------------------------------------------
+
+def view_rows(survey: dataset.Survey, dimension: str, domain: str, period: int | str) -> pd.DataFrame:
+    """Wide rows of one view joined with its cube columns (current_share, status, ...)."""
+    return survey.view(dimension, domain).join(load_cube(survey).frame(dimension, domain, period))
+
+
+def view_intervals(
+    survey: dataset.Survey, dimension: str, domain: str, period: int | str
+) -> dict[str, tuple[float, float]]:
+    """Sampling intervals of one view's summed shares and any-incident share."""
+    if period in load_cube(survey).projected:
+        return load_projected_intervals(survey).kpi(dimension, domain, period)
+    return load_intervals(survey, *delta_window(survey)).kpi(dimension, domain, period)
+
+
+def kpi(survey: dataset.Survey, dimension: str, domain: str, period: int | str) -> dict:
+    """Any-incident estimate and bounds, the summed shares and their sampling intervals."""
+    cube = load_cube(survey)
+    spread = view_intervals(survey, dimension, domain, period)
+    return {
+        "any_incident": cube.any_incident(dimension, domain, period),
+        "total": cube.total(dimension, domain, period),
+        "interval": {name: list(bounds) for name, bounds in spread.items()},
+        "correlated": cube.correlated,
+    }
+
+
+def top_deltas(survey: dataset.Survey, n: int, start: int, end: int) -> pd.DataFrame:
+    """The ``n`` largest changes with their z-test and Monte Carlo intervals."""
+    top = top_changes(survey, n, start, end)
+    tested = tested_changes(survey, start, end)
+    spread = load_intervals(survey, start, end).changes(top.index)
+    return top.join(tested[["z", "p_adj"]]).join(spread)
+
+
+def raw_numbers(survey: dataset.Survey, dimension: str, domain: str) -> pd.DataFrame:
+    """Published share/moe per wave of one view, indexed by incident type."""
+    columns = [f"{value}_{year}" for year in survey.years for value in dataset.VALUES]
+    return survey.view(dimension, domain).set_index("incident_type")[columns]
+
+
+@memoize("csv_export")
+def csv_export(survey: dataset.Survey, dimension: str, domain: str, year_choice: int | str) -> bytes:
+    df = view_rows(survey, dimension, domain, year_choice)
+    return df.to_csv(index=False, sep=";", encoding="cp1252").encode("cp1252")
@@ -0,0 +1,298 @@
+"""Risk scores for an enterprise profile (industry × region × size).
+
+SCB publishes every incident share by industry, by region and by size class,
+but never jointly. A profile is scored with a main-effects logit model per
+incident type and period,
+
+    logit p[i, r, s] = mu + a_i + b_r + c_s,
+
+raked so that its population-weighted mean over each dimension reproduces
+that dimension's published shares (iterative proportional fitting on the
+logit scale). The full (period, industry, region, size, type) tensor is
+built once per data version from the cube; scoring a profile is then an
+index lookup.
+
+The industry and region extracts only cover enterprises with 10 or more
+employees (their totals equal the COVERED_SIZE share), so the raking runs
+over the size bands inside COVERED_SIZE only. Each smaller band gets a
+size-only logit offset on top of a profile's industry × region effect,
+fitted so that its mean over the profiles reproduces the band's published
+share. ``RiskModel.covered`` lists the raked bands: their scores refer to
+the population the industry and region margins describe. Unless weights are
+given, the raked size bands are weighted by their population shares as
+implied by the published COVERED_SIZE share (covered_weights); with equal
+weights their mean would sit far above the industry and region totals.
+
+The three sets of margins agree only up to sampling error, so raking stops
+at TOLERANCE or after MAX_SWEEPS and the worst remaining gap is kept as
+``RiskModel.residual``. Suppressed shares enter as the cube's estimates;
+bands with neither a published nor an estimated share for a period keep a
+zero effect, i.e. score like the weighted average of their dimension.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+import dataset
+import incidence
+from cube import Cube
+
+PROFILE = ["industry", "region", "size"]
+
+# Published aggregates that overlap the finer bands of their dimension. Size
+# needs no list: its bands are the leaves of Survey.sizes.
+AGGREGATES = {
+    "industry": {
+        "total (SNI 10-63, 68-75, 77-82, 95.1)",
+        "ICT sector (SNI 26.1-26.4, 26.8, 46.5, 58.2, 61-62, 63.1, 95.1)",
+    },
+    "region": {"Sweden"},
+}
+# Size band whose population the industry and region extracts describe.
+COVERED_SIZE = "10 or more employees in total"
+
+MAX_SWEEPS = 200
+TOLERANCE = 1e-5  # largest margin gap, as a probability
+_EPS = 1e-4
+
+
+def band_name(dimension: str, domain: str) -> str:
+    """Profile band of a published domain; industry labels drop their SNI codes,
+    which SCB revises between waves (e.g. 69-74 -> 69-75)."""
+    return domain.split(" (SNI")[0] if dimension == "industry" else domain
+
+
+def profile_bands(survey: dataset.Survey) -> dict[str, dict[str, list[str]]]:
+    """dimension -> band -> the published domains that make up the band."""
+    bands: dict[str, dict[str, list[str]]] = {}
+    for dimension in PROFILE:
+        if dimension == "size":
+            sizes = survey.sizes
+            bands[dimension] = {sizes.labels[i]: [sizes.labels[i]] for i in sizes.leaves}
+            continue
+        bands[dimension] = {}
+        for domain in survey.domains(dimension):
+            if domain not in AGGREGATES.get(dimension, ()):
+                bands[dimension].setdefault(band_name(dimension, domain), []).append(domain)
+    return bands
+
+
+def covered_sizes(survey: dataset.Survey) -> list[str]:
+    """Size bands inside COVERED_SIZE (every size band if the extract has no such band)."""
+    sizes = survey.sizes
+    leaves = [sizes.labels[i] for i in sizes.leaves]
+    if COVERED_SIZE not in sizes.labels:
+        return leaves
+    at = sizes.labels.index(COVERED_SIZE)
+    return [sizes.labels[i] for i in sizes.leaves[sizes.first[at]:sizes.stop[at]]]
+
+
+def covered_weights(shares: np.ndarray, total: np.ndarray) -> np.ndarray:
+    """Population shares of the covered size bands, from the COVERED_SIZE share.
+
+    ``shares`` is (..., n_bands) and ``total`` (...) over types and waves. The
+    total is the population-weighted mean of its bands, so the weights are the
+    least-squares fit of total ≈ shares @ w with w ≥ 0 summing to one (equal
+    weights where that is not identified).
+    """
+    n = shares.shape[-1]
+    x, y = shares.reshape(-1, n), total.ravel()
+    ok = ~np.isnan(y) & ~np.isnan(x).any(axis=1)
+    if n == 1 or ok.sum() < n:
+        return np.full(n, 1.0 / n)
+    fit, *_ = np.linalg.lstsq(x[ok, :-1] - x[ok, -1:], y[ok] - x[ok, -1], rcond=None)
+    w = np.clip(np.r_[fit, 1.0 - fit.sum()], 0.0, None)
+    return w / w.sum() if w.sum() > 0 else np.full(n, 1.0 / n)
+
+
+def _logit(p: np.ndarray) -> np.ndarray:
+    p = np.clip(p, _EPS, 1.0 - _EPS)
+    return np.log(p) - np.log1p(-p)
+
+
+def _expit(x: np.ndarray) -> np.ndarray:
+    return 0.5 * (1.0 + np.tanh(0.5 * x))
+
+
+def rake(
+    targets: list[np.ndarray],
+    weights: list[np.ndarray],
+    max_sweeps: int = MAX_SWEEPS,
+    tol: float = TOLERANCE,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Fit main-effects logits to one set of margins per dimension.
+
+    ``targets[d]`` is (..., n_d) probabilities (NaN where unpublished) and
+    ``weights[d]`` the (n_d,) population share of each band. Returns the
+    joint probabilities (..., n_0, n_1, ...) and the largest absolute margin
+    gap per leading index.
+    """
+    lead = targets[0].shape[:-1]
+    dims = len(targets)
+    sizes = [t.shape[-1] for t in targets]
+    w = weights[0]
+    for wd in weights[1:]:
+        w = np.multiply.outer(w, wd)
+    w = w / w.sum()
+
+    def expand(values: np.ndarray, d: int) -> np.ndarray:
+        shape = [1] * dims
+        shape[d] = sizes[d]
+        return values.reshape(*lead, *shape)
+
+    known = [~np.isnan(t) for t in targets]
+    logits = [np.where(k, _logit(np.nan_to_num(t)), 0.0) for t, k in zip(targets, known)]
+    with np.errstate(invalid="ignore"):
+        counts = sum(k.sum(axis=-1) for k in known)
+        mu = np.where(counts > 0, sum(l.sum(axis=-1) for l in logits) / np.maximum(counts, 1), 0.0)
+    effects = [np.zeros((*lead, n)) for n in sizes]
+    axes = tuple(range(len(lead), len(lead) + dims))
+    gap = np.zeros(lead)
+
+    for _ in range(max_sweeps):
+        gap = np.zeros(lead)
+        for d in range(dims):
+            eta = mu.reshape(*lead, *[1] * dims) + sum(expand(e, j) for j, e in enumerate(effects))
+            other = tuple(a for j, a in enumerate(axes) if j != d)
+            margin = (_expit(eta) * w).sum(axis=other) / w.sum(axis=tuple(j for j in range(dims) if j != d))
+            effects[d] += np.where(known[d], logits[d] - _logit(margin), 0.0)
+            gap = np.maximum(gap, np.where(known[d], np.abs(margin - np.nan_to_num(targets[d])), 0.0).max(axis=-1))
+        if gap.max(initial=0.0) < tol:
+            break
+
+    eta = mu.reshape(*lead, *[1] * dims) + sum(expand(e, j) for j, e in enumerate(effects))
+    return _expit(eta), gap
+
+
+def offset(
+    base: np.ndarray,
+    weights: np.ndarray,
+    targets: np.ndarray,
+    max_sweeps: int = MAX_SWEEPS,
+    tol: float = TOLERANCE,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Shift (..., n_profiles) base probabilities by one logit offset per band.
+
+    ``targets`` is (..., n_bands) (NaN: no offset) and ``weights`` the
+    (n_profiles,) profile weights. Each offset is fitted so the weighted mean
+    over the profiles matches its target. Returns (..., n_profiles, n_bands)
+    probabilities and the largest absolute gap per leading index.
+    """
+    w = weights / weights.sum()
+    eta = _logit(base)[..., None]
+    known = ~np.isnan(targets)
+    goal = _logit(np.nan_to_num(targets))[..., None, :]
+    shift = np.zeros(targets.shape)[..., None, :]
+    gap = np.zeros(targets.shape[:-1])
+    for _ in range(max_sweeps):
+        margin = np.einsum("...pb,p->...b", _expit(eta + shift), w)
+        gap = np.where(known, np.abs(margin - np.nan_to_num(targets)), 0.0).max(axis=-1, initial=0.0)
+        if gap.max(initial=0.0) < tol:
+            break
+        shift += np.where(known, goal[..., 0, :] - _logit(margin), 0.0)[..., None, :]
+    return _expit(eta + shift), gap
+
+
+@dataclass(frozen=True)
+class RiskModel:
+    version: str
+    periods: list[int | str]
+    incident_types: list[str]
+    bands: dict[str, list[str]]  # dimension -> band names, in tensor order
+    joint: np.ndarray  # (n_periods, n_industry, n_region, n_size, n_types) shares in %
+    any: dict[str, np.ndarray]  # lower / upper / independent / estimate, (n_periods, n_industry, n_region, n_size) in %
+    residual: np.ndarray  # (n_periods,) largest remaining margin gap, percentage points
+    covered: list[str]  # size bands raked against the industry and region margins (COVERED_SIZE)
+
+    def codes(self, dimension: str, values) -> np.ndarray:
+        """Tensor positions of band names (-1 where unknown), for vectorized scoring."""
+        return pd.Categorical(values, categories=self.bands[dimension]).codes.astype(np.intp)
+
+    def score(self, industry: str, region: str, size: str, period: int | str) -> pd.DataFrame:
+        """Per-type shares for one profile, indexed by incident type."""
+        at = (
+            self.periods.index(period),
+            self.bands["industry"].index(industry),
+            self.bands["region"].index(region),
+            self.bands["size"].index(size),
+        )
+        return pd.DataFrame({"share": self.joint[at]}, index=pd.Index(self.incident_types, name="incident_type"))
+
+    def any_incident(self, industry: str, region: str, size: str, period: int | str) -> dict[str, float]:
+        """Share of enterprises with any incident for one profile: estimate and bounds, in %."""
+        at = (
+            self.periods.index(period),
+            self.bands["industry"].index(industry),
+            self.bands["region"].index(region),
+            self.bands["size"].index(size),
+        )
+        return {name: float(values[at]) for name, values in self.any.items()}
+
+
+def build_risk_model(
+    survey: dataset.Survey,
+    cube: Cube,
+    weights: dict[str, np.ndarray] | None = None,
+    correlation: np.ndarray | None = None,
+) -> RiskModel:
+    """Rake every incident type and period at once into the joint profile tensor.
+
+    ``weights`` optionally gives each dimension's band population shares (in
+    ``profile_bands`` order); bands count equally otherwise. ``correlation``
+    is passed on to the any-incident estimate, as in build_cube. Industry
+    and region are raked with the COVERED_SIZE bands; the other size bands
+    are offsets from that fit (see the module docstring).
+    """
+    bands = profile_bands(survey)
+    covered = covered_sizes(survey)
+    kinds = survey.table["incident_type"].cat.categories
+    codes = survey.table["incident_type"].cat.codes.to_numpy()
+    targets, band_weights = [], []
+    for dimension in PROFILE:
+        names = list(bands[dimension])
+        # (n_periods, n_types, n_bands); a band's labels never overlap within a wave
+        target = np.full((len(cube.periods), len(kinds), len(names)), np.nan)
+        for b, name in enumerate(names):
+            for domain in bands[dimension][name]:
+                rows = cube.slices[(dimension, domain)]
+                values = cube.estimate[rows].T / 100.0
+                slot = target[:, codes[rows], b]
+                target[:, codes[rows], b] = np.where(np.isnan(slot), values, slot)
+        targets.append(target)
+        given = None if weights is None else weights.get(dimension)
+        band_weights.append(np.ones(len(names)) if given is None else np.asarray(given, np.float64))
+
+    inside = np.isin(list(bands["size"]), covered)
+    size_target, size_weight = targets[2], band_weights[2]
+    if (weights is None or weights.get("size") is None) and ("size", COVERED_SIZE) in cube.slices:
+        rows = cube.slices[("size", COVERED_SIZE)]
+        total = np.full((len(cube.periods), len(kinds)), np.nan)
+        total[:, codes[rows]] = cube.estimate[rows].T / 100.0
+        waves = len(survey.years)  # published waves only, not the Average or projections
+        size_weight = size_weight.copy()
+        size_weight[inside] = covered_weights(size_target[:waves][..., inside], total[:waves])
+    joint, gap = rake(
+        [*targets[:2], size_target[..., inside]], [*band_weights[:2], size_weight[inside]]
+    )  # (n_periods, n_types, I, R, S covered)
+    if not inside.all():
+        # the covered population's mean per industry × region, shifted per smaller band
+        base = (joint * size_weight[inside]).sum(axis=-1) / size_weight[inside].sum()
+        profiles = np.multiply.outer(band_weights[0], band_weights[1]).ravel()
+        small, small_gap = offset(base.reshape(*base.shape[:2], -1), profiles, size_target[..., ~inside])
+        full = np.empty((*joint.shape[:-1], len(inside)))
+        full[..., inside] = joint
+        full[..., ~inside] = small.reshape(*base.shape, -1)
+        joint, gap = full, np.maximum(gap, small_gap)
+    joint = np.moveaxis(joint, 1, -1)
+    union = incidence.any_incident(joint, correlation)
+    return RiskModel(
+        version=survey.version,
+        periods=cube.periods,
+        incident_types=list(kinds),
+        bands={dimension: list(bands[dimension]) for dimension in PROFILE},
+        joint=joint * 100.0,
+        any={name: values * 100.0 for name, values in union.items()},
+        residual=gap.max(axis=1) * 100.0,
+        covered=covered,
+    )
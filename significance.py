@@ -0,0 +1,162 @@
+"""Vectorized significance tests for wave-to-wave changes in incident shares.
+
+SCB publishes each share with a 95 % margin of error, i.e. a half-width of
+1.96 standard errors. Assuming the two waves are independent samples, the
+change d = share_end - share_start has standard error
+
+    se = sqrt((moe_start / 1.96)**2 + (moe_end / 1.96)**2)
+
+and z = d / se. Two-sided p-values come from a NumPy erfc approximation, and
+multiple-testing correction (Benjamini-Hochberg or Holm) runs over every
+series at once, so the whole table is tested in a handful of array passes.
+"""
+import numpy as np
+import pandas as pd
+
+import dataset
+
+Z95 = 1.959963984540054
+
+# Margins are published as whole percents, so a reported 0 means "below 0.5".
+# Using half the rounding unit as a floor keeps z finite and conservative.
+MOE_FLOOR = 0.5
+
+# Chebyshev coefficients of the erfc approximation from Numerical Recipes
+# (erfcc); fractional error below 1.2e-7 everywhere.
+_ERFC = np.array([
+    -1.26551223, 1.00002368, 0.37409196, 0.09678418, -0.18628806,
+    0.27886807, -1.13520398, 1.48851587, -0.82215223, 0.17087277,
+])
+
+
+def erfc(x: np.ndarray) -> np.ndarray:
+    """Complementary error function, elementwise."""
+    x = np.asarray(x, dtype=np.float64)
+    # Horner's scheme in place: three buffers however long the series.
+    z = np.abs(x, out=np.empty_like(x))
+    t = np.multiply(z, 0.5, out=np.empty_like(x))
+    t += 1.0
+    np.reciprocal(t, out=t)
+    ans = np.multiply(t, _ERFC[-1], out=np.empty_like(x))
+    for coef in _ERFC[-2:0:-1]:
+        ans += coef
+        ans *= t
+    ans += _ERFC[0]
+    ans -= np.square(z, out=z)
+    np.exp(ans, out=ans)
+    ans *= t
+    return np.subtract(2.0, ans, out=ans, where=x < 0)
+
+
+def two_sided_p(z: np.ndarray) -> np.ndarray:
+    """P(|Z| >= |z|) for a standard normal Z."""
+    w = np.abs(np.asarray(z, dtype=np.float64))
+    w *= np.sqrt(0.5)
+    return erfc(w)
+
+
+def change_stats(
+    start: np.ndarray,
+    end: np.ndarray,
+    moe_start: np.ndarray,
+    moe_end: np.ndarray,
+    level: float = Z95,
+) -> dict[str, np.ndarray]:
+    """delta, se, z and two-sided p for every series; NaN where an input is missing."""
+    delta = np.subtract(end, start, dtype=np.float64)
+    # se = sqrt(moe_start² + moe_end²) / level, built in the floored copies.
+    se = np.maximum(moe_start, MOE_FLOOR, dtype=np.float64)
+    se *= se
+    floor_end = np.maximum(moe_end, MOE_FLOOR, dtype=np.float64)
+    se += np.square(floor_end, out=floor_end)
+    np.sqrt(se, out=se)
+    se /= level
+    z = np.divide(delta, se)
+    return {"delta": delta, "se": se, "z": z, "p": two_sided_p(z)}
+
+
+def _ascending(p: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Positions of the non-NaN ``p`` in ascending order, and those values.
+
+    Tied p-values end up with the same adjusted value whatever their order,
+    so an unstable (faster) sort is fine. NaNs are dropped before sorting:
+    argsort is several times slower on arrays that contain them.
+    """
+    ok = ~np.isnan(p)
+    if ok.all():
+        order = np.argsort(p)
+        return order, p[order]
+    ok = np.flatnonzero(ok)
+    values = p[ok]
+    at = np.argsort(values)
+    return ok[at], values[at]
+
+
+def benjamini_hochberg(p: np.ndarray) -> np.ndarray:
+    """BH step-up adjusted p-values (q-values); NaNs are ignored and stay NaN."""
+    p = np.asarray(p, np.float64)
+    q = np.full_like(p, np.nan)
+    order, ranked = _ascending(p)
+    m = order.size
+    if m == 0:
+        return q
+    # One sort serves the ranks, the running minimum and the scatter back.
+    ranked *= m
+    ranked /= np.arange(1, m + 1)
+    np.minimum.accumulate(ranked[::-1], out=ranked[::-1])
+    q[order] = np.minimum(ranked, 1.0, out=ranked)
+    return q
+
+
+def holm(p: np.ndarray) -> np.ndarray:
+    """Holm step-down adjusted p-values (family-wise error control); NaNs stay NaN."""
+    p = np.asarray(p, np.float64)
+    adj = np.full_like(p, np.nan)
+    order, ranked = _ascending(p)
+    m = order.size
+    if m == 0:
+        return adj
+    ranked *= np.arange(m, 0, -1)
+    np.maximum.accumulate(ranked, out=ranked)
+    adj[order] = np.minimum(ranked, 1.0, out=ranked)
+    return adj
+
+
+CORRECTIONS = {"bh": benjamini_hochberg, "holm": holm}
+
+
+def change_significance(
+    survey: dataset.Survey,
+    start: int | None = None,
+    end: int | None = None,
+    correction: str = "bh",
+    alpha: float = 0.05,
+) -> pd.DataFrame:
+    """Test every series' change between two waves (default: the two latest).
+
+    Returns one row per series with delta, se, z, p, the corrected p-value
+    ``p_adj`` and a ``significant`` flag (p_adj < alpha).
+    """
+    years = survey.years
+    start = years[-2] if start is None else start
+    end = years[-1] if end is None else end
+    table = survey.table
+    stats = change_stats(
+        table[f"share_{start}"].to_numpy(),
+        table[f"share_{end}"].to_numpy(),
+        table[f"moe_{start}"].to_numpy(),
+        table[f"moe_{end}"].to_numpy(),
+    )
+    stats["p_adj"] = CORRECTIONS[correction](stats["p"])
+    out = table[["incident_type", "domain", f"share_{start}", f"share_{end}"]].copy()
+    for name, values in stats.items():
+        out[name] = values
+    out["significant"] = out["p_adj"] < alpha
+    return out
+
+
+def significant_changes(tested: pd.DataFrame, n: int | None = None) -> pd.DataFrame:
+    """Significant series ranked by |z| (strongest evidence first), optionally the top ``n``."""
+    sig = tested[tested["significant"]]
+    ranked = sig.iloc[np.argsort(-np.abs(sig["z"].to_numpy()), kind="stable")]
+    return ranked if n is None else ranked.head(n)
@@ -0,0 +1,64 @@
+"""Server-side chart transforms: sorting, top-N with an "other" bucket, binning.
+
+Vega-Lite can sort, aggregate and bin in the browser, but then the spec has
+to carry every raw row and the client does the work. These NumPy versions
+run before the data reaches Altair (and only on spec-cache misses), so a
+chart's payload is bounded by ``n`` or the bin count, however many incident
+types or domains the view has. Charts built from their output keep the data
+order (``sort=None``) instead of sorting client-side.
+"""
+import numpy as np
+import pandas as pd
+
+OTHER = "Other"
+
+
+def sort_desc(frame: pd.DataFrame, value: str) -> pd.DataFrame:
+    """Rows by descending ``value`` (stable; NaN last)."""
+    values = frame[value].to_numpy(dtype=np.float64)
+    order = np.argsort(-np.nan_to_num(values, nan=-np.inf), kind="stable")
+    return frame.iloc[order]
+
+
+def top_n(
+    frame: pd.DataFrame,
+    label: str,
+    value: str,
+    n: int,
+    how: str = "sum",
+    fill: dict[str, object] | None = None,
+) -> pd.DataFrame:
+    """The ``n`` largest rows by ``value``, sorted, plus one row for the rest.
+
+    The rest is folded into a row labelled "Other (k)" whose ``value`` is the
+    ``how`` ("sum" or "mean") of theirs; ``fill`` sets its other columns
+    (default NaN). With ``n`` or fewer rows, only the sort is applied.
+    """
+    ranked = sort_desc(frame, value)
+    if len(ranked) <= n:
+        return ranked
+    head, rest = ranked.iloc[:n], ranked.iloc[n:]
+    values = rest[value].to_numpy(dtype=np.float64)
+    folded = np.nansum(values) if how == "sum" else np.nanmean(values)
+    row: dict[str, object] = {column: np.nan for column in frame.columns}
+    row.update(fill or {})
+    row[label] = f"{OTHER} ({len(rest)})"
+    row[value] = folded
+    # categorical columns come out as plain objects so the new label fits
+    return pd.DataFrame({column: np.append(head[column].to_numpy(), row[column]) for column in frame.columns})
+
+
+def histogram(
+    values: np.ndarray,
+    bins: int = 40,
+    value_range: tuple[float, float] | None = None,
+) -> pd.DataFrame:
+    """Counts of ``values`` (NaN skipped) in equal-width bins: bin_start / bin_end / count."""
+    values = np.asarray(values, dtype=np.float64)
+    values = values[~np.isnan(values)]
+    if value_range is None:
+        value_range = (float(values.min()), float(values.max())) if len(values) else (0.0, 1.0)
+        if value_range[0] == value_range[1]:
+            value_range = (value_range[0] - 0.5, value_range[1] + 0.5)
+    counts, edges = np.histogram(values, bins=bins, range=value_range)
+    return pd.DataFrame({"bin_start": edges[:-1], "bin_end": edges[1:], "count": counts})
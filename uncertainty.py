@@ -0,0 +1,293 @@
+"""Monte Carlo uncertainty for the dashboard's KPIs and top-5 changes.
+
+Each published share is treated as normal with standard error moe / 1.96
+(margins below MOE_FLOOR are floored, as in significance.py), truncated to
+[0, 100]; suppressed shares draw around their estimate (imputation.py) with
+its margin, so the intervals match the cube's totals and unions. Every
+series is drawn at once, in seeded chunks laid out as
+``(n_periods, n_series, chunk)`` float32 planes, and the derived quantities
+are computed per draw:
+
+* per view and period (each wave and the Average, or with ``ahead`` the
+  projected waves): the sum of the type shares ("cumulative") and the
+  any-incident share under independence;
+* per series: the change between two waves, and how often the series lands
+  in the top-n by |change| (rank stability of the top-5 table); only series
+  reported in both waves take part, as in Survey.top_changes.
+
+Draws come in antithetic pairs (z, -z), halving the generator work. Rather
+than keeping every draw, each quantity is streamed into a histogram and the
+interval ends are read off its cumulative counts, so memory does not grow
+with the number of draws. Single shares and their Average are linear in the
+inputs, so their intervals are closed-form. The projected waves are drawn
+independently of the survey waves, so they are a separate, lazily run
+simulation: the default one fits the draw budget of a first render.
+
+Work and memory are bounded for large tables: the draw count shrinks to stay
+within DRAW_BUDGET series-draws, and histograms coarsen beyond BIN to stay
+within HISTOGRAM_CELLS counters.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+import dataset
+from forecast import project
+from imputation import impute
+from significance import MOE_FLOOR, Z95
+
+LEVEL = 0.95
+MAX_DRAWS = 100_000
+MIN_DRAWS = 200
+DRAW_BUDGET = 20_000_000
+# Finest histogram resolution in percentage points; the UI shows one decimal.
+BIN = 0.05
+HISTOGRAM_CELLS = 1 << 22
+# Series-draws per chunk plane: small enough for the chunk buffers to stay in
+# cache, but at least MIN_CHUNK draws so that wide tables amortise the per-chunk
+# view gathers.
+CHUNK_CELLS = 1 << 17
+MIN_CHUNK = 16
+
+
+@dataclass(frozen=True)
+class Intervals:
+    version: str
+    draws: int
+    level: float
+    periods: list[int | str]  # the simulated periods: waves and Average, or the projected waves
+    start: int
+    end: int
+    total: np.ndarray  # (n_views, n_periods, 2) lower / upper of the summed shares
+    any: np.ndarray  # (n_views, n_periods, 2) lower / upper of P(any) in %, independence
+    share: np.ndarray  # (n_series, n_periods, 2) lower / upper of each share
+    delta: np.ndarray  # (n_series, 2) lower / upper of share_end - share_start (NaN with ``ahead``)
+    top_freq: np.ndarray  # (n_series,) share of draws in which the series is in the top n
+    positions: dict[tuple[str, str], int]
+
+    def kpi(self, dimension: str, domain: str, period: int | str) -> dict[str, tuple[float, float]]:
+        """Intervals of the summed shares and of the any-incident share for one view."""
+        at = (self.positions[(dimension, domain)], self.periods.index(period))
+        return {
+            "total": (float(self.total[at][0]), float(self.total[at][1])),
+            "any": (float(self.any[at][0]), float(self.any[at][1])),
+        }
+
+    def changes(self, index: pd.Index) -> pd.DataFrame:
+        """delta_lo / delta_hi / top_freq for rows of Survey.table, by index label."""
+        rows = np.asarray(index)
+        return pd.DataFrame(
+            {
+                "delta_lo": self.delta[rows, 0],
+                "delta_hi": self.delta[rows, 1],
+                "top_freq": self.top_freq[rows],
+            },
+            index=index,
+        )
+
+
+class _Histograms:
+    """Counts of values per (row, bin) over [lo, hi], filled chunk by chunk."""
+
+    def __init__(self, rows: tuple[int, ...], lo: float, hi: float, chunk: int):
+        n_rows = int(np.prod(rows))
+        self.rows = rows
+        self.lo = lo
+        self.bins = int(min(round((hi - lo) / BIN) + 1, max(HISTOGRAM_CELLS // max(n_rows, 1), 64)))
+        self.scale = (self.bins - 1) / (hi - lo)
+        self.offsets = np.arange(0, n_rows * self.bins, self.bins, dtype=np.intp).reshape(*rows, 1)
+        self.counts = np.zeros(n_rows * self.bins, np.int64)
+        # Per-chunk buffers, so adding allocates nothing.
+        self.scaled = np.empty((*rows, chunk), np.float32)
+        self.cells = np.empty((*rows, chunk), np.intp)
+
+    def add(self, values: np.ndarray) -> None:
+        """Add values of shape (*rows, c), for c up to the chunk."""
+        c = values.shape[-1]
+        scaled, cells = self.scaled[..., :c], self.cells[..., :c]
+        # Values already lie within [lo, hi], so truncating x + 0.5 rounds.
+        np.multiply(values, np.float32(self.scale), out=scaled)
+        scaled += np.float32(0.5 - self.lo * self.scale)
+        cells[...] = scaled
+        cells += self.offsets
+        np.add.at(self.counts, cells.ravel(), 1)
+
+    def bounds(self, level: float) -> np.ndarray:
+        """Equal-tailed interval per row, as (*rows, 2)."""
+        cum = self.counts.reshape(-1, self.bins).cumsum(axis=1)
+        n = cum[:, -1:]
+        ends = [(cum < n * (1 - level) / 2).sum(axis=1), (cum < n * (1 + level) / 2).sum(axis=1)]
+        return (self.lo + np.stack(ends, axis=-1) / self.scale).reshape(*self.rows, 2)
+
+
+def _view_blocks(slices: dict) -> list[tuple[int, np.ndarray, np.ndarray]]:
+    """(width, views, first rows) per view width, so views of equal width reduce together."""
+    widths = np.fromiter((s.stop - s.start for s in slices.values()), dtype=np.intp, count=len(slices))
+    starts = np.fromiter((s.start for s in slices.values()), dtype=np.intp, count=len(slices))
+    return [(int(w), np.flatnonzero(widths == w), starts[widths == w]) for w in np.unique(widths[widths > 0])]
+
+
+def _reduce_views(ufunc: np.ufunc, planes: np.ndarray, blocks: list, out: np.ndarray) -> np.ndarray:
+    """``ufunc`` over each view's rows of (n_periods, n_series, c) planes, into (n_periods, n_views, c).
+
+    ufunc.reduceat along the series axis is several times slower than these
+    whole-row operations, one per position within a view.
+    """
+    for width, views, first in blocks:
+        acc = planes[:, first]
+        for j in range(1, width):
+            ufunc(acc, planes[:, first + j], out=acc)
+        out[:, views] = acc
+    return out
+
+
+def default_draws(n_series: int) -> int:
+    """MAX_DRAWS, fewer for tables so large that DRAW_BUDGET would be exceeded."""
+    return int(np.clip(DRAW_BUDGET // max(n_series, 1), MIN_DRAWS, MAX_DRAWS))
+
+
+def simulate(
+    survey: dataset.Survey,
+    draws: int | None = None,
+    seed: int = 0,
+    top_n: int = 5,
+    start: int | None = None,
+    end: int | None = None,
+    level: float = LEVEL,
+    ahead: bool = False,
+) -> Intervals:
+    """Draw every series ``draws`` times and summarise the derived quantities.
+
+    ``start`` / ``end`` default to the two latest waves, like Survey.top_changes.
+    With ``ahead`` the projected waves are simulated instead of the survey
+    waves, and the per-series changes are left out.
+    """
+    years = survey.years
+    start = years[max(len(years) - 2, 0)] if start is None else start
+    end = years[-1] if end is None else end
+    table = survey.table
+    n_series, n_years = len(table), len(years)
+    draws = default_draws(n_series) if draws is None else draws
+    chunk = int(np.clip(CHUNK_CELLS // max(n_series, 1), MIN_CHUNK, draws))
+
+    imputed = impute(survey)
+    projection = project(survey, imputed)
+    ahead_mean = np.nan_to_num(projection.share.T).astype(np.float32)
+    ahead_sd = np.nan_to_num(projection.moe.T / Z95, posinf=0).astype(np.float32)
+    share = imputed.share.astype(np.float32).T
+    moe = np.maximum(imputed.moe.astype(np.float32).T, MOE_FLOOR)
+    missing = np.isnan(share)  # (n_years, n_series), like every array below
+    reported = ~missing & ~imputed.estimated.T
+    # Missing cells draw as exactly 0, which leaves sums and unions untouched.
+    mean = np.where(missing, 0, share).astype(np.float32)
+    sd = np.where(missing, 0, np.nan_to_num(moe) / Z95).astype(np.float32)
+    # Average weights, as in build_cube: the reported waves, else the estimates.
+    use = np.where(reported.any(axis=0), reported, ~missing)
+    counts = use.sum(axis=0)
+    weight = np.where(use, np.divide(1, counts, out=np.zeros(n_series), where=counts > 0), 0).astype(np.float32)
+    a, b = years.index(start), years.index(end)
+    pair_ok = reported[a] & reported[b]
+    # Series without both waves can never make the top-n.
+    ranks = np.flatnonzero(pair_ok)
+    ranked = bool(top_n) and not ahead and len(ranks) > top_n
+
+    if ahead:
+        periods: list[int | str] = list(projection.years)
+        centre, spread = ahead_mean, ahead_sd
+    else:
+        periods = [*years, dataset.AVERAGE]
+        centre, spread = mean, sd
+    n_drawn = len(centre)
+
+    slices = survey.selections()
+    blocks = _view_blocks(slices)
+    widest = max((s.stop - s.start for s in slices.values()), default=1)
+    n_views = len(slices)
+
+    total = _Histograms((len(periods), n_views), 0, 100 * widest, chunk)
+    union = _Histograms((len(periods), n_views), 0, 100, chunk)
+    delta = None if ahead else _Histograms((n_series,), -100, 100, chunk)
+    in_top = np.zeros(n_series, np.int64)
+    rng = np.random.default_rng(seed)
+    # Period-major planes, series by draw, so every per-series operation is
+    # on contiguous rows; the waves are followed by their Average.
+    shares = np.empty((len(periods), n_series, chunk), np.float32)
+    noise = np.empty(n_series * ((chunk + 1) // 2), np.float32)
+    sums = np.zeros((len(periods), n_views, chunk), np.float32)
+    nones = np.ones((len(periods), n_views, chunk), np.float32)
+    scratch = np.empty((n_series, chunk), np.float32)
+    scores = np.empty((len(ranks), chunk), np.float32)
+
+    def draw(planes: np.ndarray, c: int) -> None:
+        half = (c + 1) // 2
+        z = noise[: n_series * half].reshape(n_series, half)
+        for plane, mu, s in zip(planes, centre[:, :, None], spread[:, :, None]):
+            rng.standard_normal(dtype=np.float32, out=z)
+            z *= s
+            np.add(mu, z, out=plane[:, :half])
+            np.subtract(mu, z[:, : c - half], out=plane[:, half:])  # antithetic partner
+        np.clip(planes, 0, 100, out=planes)
+
+    for lo in range(0, draws, chunk):
+        c = min(chunk, draws - lo)
+        x = shares[:n_drawn, :, :c]
+        draw(x, c)
+        if delta is not None:
+            avg = np.multiply(x[0], weight[0][:, None], out=shares[n_years, :, :c])
+            for k in range(1, n_years):
+                avg += np.multiply(x[k], weight[k][:, None], out=scratch[:, :c])
+
+            d = np.subtract(x[b], x[a], out=scratch[:, :c])
+            delta.add(d)
+            if ranked:
+                score = np.abs(np.take(d, ranks, axis=0, out=scores[:, :c]), out=scores[:, :c])
+                # in the top-n: at least the n-th largest score of the draw
+                kth = np.partition(score, len(ranks) - top_n, axis=0)[len(ranks) - top_n]
+                in_top[ranks] += np.count_nonzero(score >= kth, axis=1)
+
+        if n_views:
+            view = shares[:, :, :c]
+            total.add(_reduce_views(np.add, view, blocks, sums[:, :, :c]))
+            # P(any) = 1 - prod(1 - p) over each view's series.
+            view *= np.float32(-0.01)
+            view += 1
+            none = _reduce_views(np.multiply, view, blocks, nones[:, :, :c])
+            none -= 1
+            none *= -100
+            union.add(none)
+
+    if top_n and not ahead and not ranked:
+        in_top[pair_ok] = draws
+
+    # Waves, their Average and the projections are linear in normal shares:
+    # closed-form intervals.
+    if ahead:
+        centre_iv, width = projection.share, Z95 * ahead_sd.T
+    else:
+        width = np.where(missing, np.nan, Z95 * sd)
+        avg_mean = np.where(counts > 0, (mean * weight).sum(axis=0), np.nan)
+        avg_width = np.where(counts > 0, Z95 * np.sqrt(np.square(sd * weight).sum(axis=0)), np.nan)
+        centre_iv = np.column_stack([share.T, avg_mean])
+        width = np.column_stack([width.T, avg_width])
+    share_iv = np.clip(np.stack([centre_iv - width, centre_iv + width], axis=-1), 0, 100)
+
+    if delta is None:
+        delta_iv = np.full((n_series, 2), np.nan)
+    else:
+        delta_iv = delta.bounds(level)
+        delta_iv[~pair_ok] = np.nan
+    return Intervals(
+        version=survey.version,
+        draws=draws,
+        level=level,
+        periods=periods,
+        start=start,
+        end=end,
+        total=total.bounds(level).transpose(1, 0, 2),
+        any=union.bounds(level).transpose(1, 0, 2),
+        share=share_iv,
+        delta=delta_iv,
+        top_freq=in_top / draws,
+        positions={key: i for i, key in enumerate(slices)},
+    )